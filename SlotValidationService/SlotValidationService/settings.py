@@ -136,6 +136,70 @@ REST_FRAMEWORK = {
     ]
 }
 
+# Payload limits, enforced while the body is read (validations/payload_limits.py)
+# None disables a limit
+
+PAYLOAD_MAX_BODY_BYTES = 2 * 1024 * 1024
+PAYLOAD_MAX_VALUES = 1000
+PAYLOAD_MAX_SUPPORTED_VALUES = 10000
+PAYLOAD_MAX_DEPTH = 32
+PAYLOAD_READ_CHUNK_BYTES = 64 * 1024
+
+# Render validation results from cached byte templates instead of
+# the DRF renderer (validations/renderers.py)
+
+RESPONSE_FAST_PATH = True
+
+# Sampling profiler (validations/profiler.py)
+
+PROFILER_DEFAULT_SECONDS = 10
+PROFILER_MAX_SECONDS = 60
+PROFILER_DEFAULT_INTERVAL = 0.005
+PROFILER_MIN_INTERVAL = 0.001
+
+# Unix domain socket sidecar (validations/sidecar.py)
+
+SIDECAR_SOCKET_PATH = os.getenv('SIDECAR_SOCKET_PATH', '/tmp/slot-validation.sock')
+SIDECAR_SOCKET_MODE = 0o660
+# larger frames would be rejected by the payload limits, they are not read
+SIDECAR_MAX_FRAME_BYTES = PAYLOAD_MAX_BODY_BYTES or 10 * 1024 * 1024
+
+# Admission control of the validation views (validations/admission.py)
+# set ADMISSION_MAX_IN_FLIGHT to None to disable it
+
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv('ADMISSION_MAX_IN_FLIGHT', 32))
+ADMISSION_MAX_QUEUE = 64
+ADMISSION_QUEUE_TIMEOUT = 0.5
+ADMISSION_RETRY_AFTER = 1
+ADMISSION_PRIORITIZE_SMALL = True
+ADMISSION_ADAPTIVE = False
+ADMISSION_MIN_IN_FLIGHT = 4
+ADMISSION_TARGET_LATENCY = 0.05
+
+# Coalescing of identical requests in flight (validations/coalescing.py)
+
+COALESCING_ENABLED = True
+COALESCING_MAX_KEYS = 1024
+COALESCING_WAIT_TIMEOUT = 1.0
+
+# Shadow mode (validations/shadow.py)
+# dotted path of an alternative engine module, None to disable
+
+SHADOW_ENGINE = os.getenv('SHADOW_ENGINE') or None
+SHADOW_SAMPLE_RATE = float(os.getenv('SHADOW_SAMPLE_RATE', 0.01))
+SHADOW_QUEUE_SIZE = 1000
+SHADOW_WORKERS = 2
+SHADOW_MAX_MISMATCHES = 100
+
+# Memory accounting (validations/memory.py)
+# set MEMORY_BUDGET_BYTES to None to disable the budget
+
+MEMORY_SAMPLE_RATE = float(os.getenv('MEMORY_SAMPLE_RATE', 0))
+MEMORY_TRACE_FRAMES = 1
+MEMORY_TOP_SITES = 20
+MEMORY_BUDGET_BYTES = 512 * 1024 * 1024
+MEMORY_EXPANSION_FACTOR = 10
+
 # Logging Configuration
 
 # Clear prev config
@@ -21,4 +21,9 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('validate/finite/', views.FiniteValuesValidationView.as_view()),
     path('validate/numeric/', views.NumericValuesValidationView.as_view()),
+    path('validate/pattern/', views.PatternValuesValidationView.as_view()),
+    path('validate/datetime/', views.DatetimeValuesValidationView.as_view()),
+    path('diagnostics/profile/', views.ProfileView.as_view()),
+    path('diagnostics/metrics/', views.MetricsView.as_view()),
+    path('diagnostics/memory/', views.MemoryView.as_view()),
 ]
@@ -0,0 +1,265 @@
+"""
+Admission control for the validation views.
+
+At most a bounded number of requests are validated at a time in a
+worker. Requests over that limit wait in a bounded queue for a short
+while, and are shed with a 503 and a Retry-After header when the queue
+is full or the wait times out, so a burst past capacity fails fast
+instead of making every caller time out together.
+
+Waiting requests are admitted smallest first (by body size) when
+ADMISSION_PRIORITIZE_SMALL is set, so a few requests with huge values
+or supported_values lists cannot hold up the small ones. When the queue
+is full, a request smaller than the largest waiter takes its place and
+the largest waiter is shed.
+
+With ADMISSION_ADAPTIVE the limit is tuned from the observed latency:
+it grows by one every `limit` requests while the average latency is
+under ADMISSION_TARGET_LATENCY and shrinks by 10% (at most once per
+average latency) when it is over.
+"""
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict
+
+from django.conf import settings
+
+from .slot_validation_error import OverloadError
+
+logger = logging.getLogger(__name__)
+
+# weight of the latest sample in the average latency
+EWMA_WEIGHT = 0.1
+
+class AdmissionController:
+    """
+    Bounded in-flight limit with a bounded priority queue of waiters
+    """
+
+    def __init__(
+            self,
+            max_in_flight: int,
+            max_queue: int,
+            queue_timeout: float,
+            retry_after: int = 1,
+            prioritize_small: bool = True,
+            adaptive: bool = False,
+            min_in_flight: int = 1,
+            target_latency: float = None,
+        ):
+        """
+        :param max_in_flight: the limit of requests validated at a time,
+            upper bound of the limit when adaptive
+        :param max_queue: the number of requests which can wait for a slot
+        :param queue_timeout: seconds a request waits for a slot before
+            being shed
+        :param retry_after: seconds sent back in the Retry-After header
+        :param prioritize_small: admit waiting requests by ascending cost
+            instead of arrival order
+        :param adaptive: tune the limit from the observed latency
+        :param min_in_flight: lower bound of the limit when adaptive
+        :param target_latency: average latency in seconds above which the
+            limit is lowered when adaptive
+        """
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.prioritize_small = prioritize_small
+        self.adaptive = adaptive
+        self.min_in_flight = min_in_flight
+        self.target_latency = target_latency
+        self.limit = float(max_in_flight)
+        self.in_flight = 0
+        self.queued = 0
+        # heap of waiters, each waiter is
+        # [cost, arrival number, event, cancelled, evicted]
+        self.waiters = []
+        self.arrivals = itertools.count()
+        self.latency = None
+        self.last_decrease = 0.0
+        self.counters = Counter()
+        self.lock = threading.Lock()
+
+    def shed(self, reason: str) -> OverloadError:
+        self.counters['shed'] += 1
+        self.counters['shed_{}'.format(reason)] += 1
+        logger.warning('Request shed, {} (in flight: {}, queued: {})'.format(
+            reason, self.in_flight, self.queued,
+        ))
+        return OverloadError('Service is overloaded, retry later.', self.retry_after)
+
+    def acquire(self, cost: int = 0) -> None:
+        """
+        Take an in-flight slot, waiting in the queue if needed.
+        Raise OverloadError if the request is shed.
+
+        :param cost: relative size of the request
+        """
+        with self.lock:
+            if self.in_flight < int(self.limit) and not self.queued:
+                self.in_flight += 1
+                self.counters['admitted'] += 1
+                return
+            if self.queued >= self.max_queue:
+                largest = self.get_largest_waiter()
+                if largest is None or largest[0] <= cost:
+                    raise self.shed('queue_full')
+                # the newcomer would be let in first, shed the largest instead
+                largest[4] = True
+                self.discard(largest)
+                largest[2].set()
+            waiter = [
+                cost if self.prioritize_small else 0,
+                next(self.arrivals),
+                threading.Event(),
+                False,
+                False,
+            ]
+            heapq.heappush(self.waiters, waiter)
+            self.queued += 1
+            self.counters['queued'] += 1
+        if waiter[2].wait(self.queue_timeout) and not waiter[4]:
+            return
+        with self.lock:
+            if waiter[4]:
+                raise self.shed('evicted')
+            if waiter[2].is_set():
+                # the slot was handed over right after the timeout
+                return
+            self.discard(waiter)
+            raise self.shed('timeout')
+
+    def get_largest_waiter(self) -> list:
+        """
+        Called with the lock held.
+
+        :return: the waiter with the largest cost, the latest one among
+            equals, None if the waiters are not prioritized
+        """
+        if not self.prioritize_small:
+            return None
+        waiting = [waiter for waiter in self.waiters if not waiter[3]]
+        return max(waiting, key=lambda waiter: waiter[:2], default=None)
+
+    def discard(self, waiter: list) -> None:
+        """
+        Remove a waiter from the queue. It is left in the heap and
+        skipped when popped, until the heap is compacted. Called with
+        the lock held.
+
+        :param waiter: a waiter in the queue
+        """
+        waiter[3] = True
+        self.queued -= 1
+        if len(self.waiters) - self.queued > self.max_queue:
+            # too many cancelled waiters, e.g. large ones timing out
+            # at the bottom of the heap under sustained overload
+            self.waiters = [waiter for waiter in self.waiters if not waiter[3]]
+            heapq.heapify(self.waiters)
+
+    def release(self, latency: float) -> None:
+        """
+        Give back a slot, handing it to the waiters if any
+
+        :param latency: seconds the request took once admitted
+        """
+        with self.lock:
+            self.in_flight -= 1
+            if self.adaptive:
+                self.adapt(latency)
+            while self.waiters and self.in_flight < int(self.limit):
+                waiter = heapq.heappop(self.waiters)
+                if waiter[3]:
+                    continue
+                self.queued -= 1
+                self.in_flight += 1
+                self.counters['admitted'] += 1
+                waiter[2].set()
+
+    def adapt(self, latency: float) -> None:
+        """
+        Additive increase, multiplicative decrease of the limit
+        against the target latency. Called with the lock held.
+
+        :param latency: seconds the last request took
+        """
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += EWMA_WEIGHT * (latency - self.latency)
+        if self.latency > self.target_latency:
+            now = time.monotonic()
+            if now - self.last_decrease > self.latency:
+                self.limit = max(float(self.min_in_flight), self.limit * 0.9)
+                self.last_decrease = now
+        else:
+            self.limit = min(float(self.max_in_flight), self.limit + 1 / self.limit)
+
+    def snapshot(self) -> Dict:
+        """
+        :return: current state and counters, for the metrics endpoint
+        """
+        with self.lock:
+            return {
+                'limit': int(self.limit),
+                'in_flight': self.in_flight,
+                'queue_depth': self.queued,
+                'average_latency_ms': None if self.latency is None else self.latency * 1e3,
+                'admitted': self.counters['admitted'],
+                'queued': self.counters['queued'],
+                'shed': self.counters['shed'],
+                'shed_queue_full': self.counters['shed_queue_full'],
+                'shed_timeout': self.counters['shed_timeout'],
+                'shed_evicted': self.counters['shed_evicted'],
+            }
+
+_controller = None
+_controller_lock = threading.Lock()
+
+def get_controller() -> AdmissionController:
+    """
+    :return: the controller of this worker built from settings,
+        None if admission control is disabled
+    """
+    global _controller
+    if settings.ADMISSION_MAX_IN_FLIGHT is None:
+        return None
+    if _controller is None:
+        with _controller_lock:
+            if _controller is None:
+                _controller = AdmissionController(
+                    settings.ADMISSION_MAX_IN_FLIGHT,
+                    settings.ADMISSION_MAX_QUEUE,
+                    settings.ADMISSION_QUEUE_TIMEOUT,
+                    settings.ADMISSION_RETRY_AFTER,
+                    settings.ADMISSION_PRIORITIZE_SMALL,
+                    settings.ADMISSION_ADAPTIVE,
+                    settings.ADMISSION_MIN_IN_FLIGHT,
+                    settings.ADMISSION_TARGET_LATENCY,
+                )
+    return _controller
+
+@contextmanager
+def admit(cost: int = 0):
+    """
+    Context manager holding an in-flight slot for the duration
+    of the block. Raise OverloadError if the request is shed.
+
+    :param cost: relative size of the request, the body size is used
+    """
+    controller = get_controller()
+    if controller is None:
+        yield
+        return
+    controller.acquire(cost)
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        controller.release(time.monotonic() - start)
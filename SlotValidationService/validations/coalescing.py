@@ -0,0 +1,141 @@
+"""
+Coalescing of identical validation requests in flight.
+
+Retries and fan out can make several identical payloads arrive at a
+worker at the same time. The first one (the leader) runs the engine,
+and the ones which arrive while it is running wait for it and share
+its result, or its error, instead of repeating the work.
+
+Both the wait and the memory are bounded: a request waits at most
+COALESCING_WAIT_TIMEOUT seconds before running the engine itself, and
+at most COALESCING_MAX_KEYS distinct payloads are tracked at a time.
+Nothing is kept once the leader is done, this is not a cache.
+"""
+import hashlib
+import json
+import logging
+import threading
+from collections import Counter
+from typing import Callable, Dict
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+def payload_key(namespace: str, data: Dict) -> str:
+    """
+    Hash of a payload which does not depend on the order of its keys
+
+    :param namespace: kept apart from other namespaces, e.g. the view
+    :param data: the parsed request json
+    :return: the hex digest
+    """
+    normalized = json.dumps([namespace, data], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+class InFlightCall:
+    """
+    Computation run by a leader, waited on by the followers
+    """
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class Coalescer:
+    """
+    Table of the computations in flight by payload key
+    """
+
+    def __init__(self, max_keys: int, wait_timeout: float):
+        """
+        :param max_keys: maximum number of computations tracked at a time,
+            requests beyond it run on their own
+        :param wait_timeout: seconds a follower waits for the leader
+            before running on its own
+        """
+        self.max_keys = max_keys
+        self.wait_timeout = wait_timeout
+        self.calls = {}
+        self.counters = Counter()
+        self.lock = threading.Lock()
+
+    def run(self, key: str, compute: Callable):
+        """
+        Run compute, or wait for the identical computation in flight
+
+        :param key: the payload key
+        :param compute: the computation, called without arguments
+        :return: the result of compute. Its error is raised, to the
+            followers as well.
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if not leader:
+                self.counters['followers'] += 1
+            elif len(self.calls) < self.max_keys:
+                call = self.calls[key] = InFlightCall()
+                self.counters['leaders'] += 1
+            else:
+                self.counters['bypassed'] += 1
+        if call is None:
+            # too many keys in flight
+            return compute()
+        if leader:
+            try:
+                call.result = compute()
+            except Exception as e:
+                call.error = e
+                raise
+            finally:
+                with self.lock:
+                    del self.calls[key]
+                call.done.set()
+            return call.result
+        if not call.done.wait(self.wait_timeout):
+            with self.lock:
+                self.counters['wait_timeouts'] += 1
+            logger.warning('Coalesced request timed out waiting, running it alone')
+            return compute()
+        with self.lock:
+            self.counters['coalesced'] += 1
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def snapshot(self) -> Dict:
+        """
+        :return: current state and counters, for the metrics endpoint
+        """
+        with self.lock:
+            return {
+                'in_flight_keys': len(self.calls),
+                'leaders': self.counters['leaders'],
+                'followers': self.counters['followers'],
+                'coalesced': self.counters['coalesced'],
+                'wait_timeouts': self.counters['wait_timeouts'],
+                'bypassed': self.counters['bypassed'],
+            }
+
+_coalescer = None
+_coalescer_lock = threading.Lock()
+
+def get_coalescer() -> Coalescer:
+    """
+    :return: the coalescer of this worker built from settings,
+        None if coalescing is disabled
+    """
+    global _coalescer
+    if not settings.COALESCING_ENABLED:
+        return None
+    if _coalescer is None:
+        with _coalescer_lock:
+            if _coalescer is None:
+                _coalescer = Coalescer(
+                    settings.COALESCING_MAX_KEYS,
+                    settings.COALESCING_WAIT_TIMEOUT,
+                )
+    return _coalescer
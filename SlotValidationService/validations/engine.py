@@ -4,8 +4,14 @@ validation resides
 """
 import ast
 import logging
+import re
+from datetime import datetime, time, timedelta
+from functools import lru_cache
 from typing import List, Dict, Callable, Tuple
 
+from dateutil import parser as dateutil_parser
+from dateutil import tz
+
 from .slot_validation_error import SlotValidationError
 
 # alias for slot validation result tuple
@@ -13,6 +19,18 @@ SlotValidationResult = Tuple[bool, bool, str, Dict]
 
 logger = logging.getLogger(__name__)
 
+# number of compiled patterns kept for pattern validation
+PATTERN_CACHE_SIZE = 256
+# longer values are never matched against a pattern, this bounds
+# the time a single match can take as python regexes cannot time out.
+# It is well above the length of the ids, phone numbers and emails
+# extracted by NLU.
+PATTERN_MAX_VALUE_LENGTH = 256
+
+# relative times in datetime constraints, e.g. now, today+30d, -2h
+RELATIVE_TIME_REGEX = re.compile(r'^(now|today)?(?:([+-]\d+)([mhdw]))?$')
+RELATIVE_TIME_UNITS = {'m': 'minutes', 'h': 'hours', 'd': 'days', 'w': 'weeks'}
+
 def is_value_valid_finite(
         value_dict: Dict[str, str], 
         supported_values: List[str] = None
@@ -156,6 +174,51 @@ def is_value_valid_numeric(
     
     return res
 
+def get_filtered_values_result(
+        valid_value_list: List,
+        values: List[Dict],
+        invalid_trigger: str,
+        key: str,
+        pick_first: bool,
+    ) -> SlotValidationResult:
+    """
+    Builds the result of a validation where the invalid values are
+    filtered out (numeric, pattern and datetime validation): the slot
+    is filled only if all values are valid, and the valid values are
+    sent back in the params.
+
+    :param valid_value_list: the values which are valid, in order
+    :param values: Values extracted by NLU
+    :param invalid_trigger: Trigger to use if a value is not valid
+    :param key: Dict key to use in the params returned
+    :param pick_first: Set to true if the first value is to be picked up
+    :return: a tuple of (filled, partially_filled, trigger, params)
+    """
+    if len(valid_value_list) == len(values):
+        # all values were valid
+        filled = True
+        partially_filled = False
+        trigger = ''
+    else:
+        filled = False
+        partially_filled = True
+        trigger = invalid_trigger
+    if len(valid_value_list) == 0:
+        # no value was valid
+        params = {}
+    elif pick_first:
+        params = { key: valid_value_list[0] }
+    else:
+        # all valid values must be added
+        params_list = []
+        for v in valid_value_list:
+            if isinstance(v, str):
+                params_list.append(v.upper())
+            else:
+                params_list.append(v)
+        params = { key: params_list }
+    return (filled, partially_filled, trigger, params)
+
 def validate_numeric_entity(
         values: List[Dict],
         invalid_trigger: str = None,
@@ -203,35 +266,297 @@ def validate_numeric_entity(
     for value_dict in values:
         if is_value_valid_numeric(var_name, value_dict, constraint):
             valid_value_list.append(value_dict['value'])
-    if len(valid_value_list) == len(values):
-        # all values were valid
-        filled = True
-        partially_filled = False
-        trigger = ''
-    else:
-        filled = False
-        partially_filled = True
-        trigger = invalid_trigger
-    if len(valid_value_list) == 0:
-        # no value was valid
-        params = {}
-    elif pick_first:
-        params = { key: valid_value_list[0] }
-    else:
-        # all valid values must be added
-        params_list = []
-        for v in valid_value_list:
-            if isinstance(v, str):
-                params_list.append(v.upper())
+    return get_filtered_values_result(valid_value_list, values, invalid_trigger, key, pick_first)
+
+@lru_cache(maxsize=PATTERN_CACHE_SIZE)
+def compile_pattern(pattern: str):
+    """
+    Compiles a pattern, the latest PATTERN_CACHE_SIZE patterns
+    are cached so that repeated requests skip compilation.
+
+    :param pattern: a regular expression
+    :return: the compiled pattern
+    """
+    try:
+        return re.compile(pattern)
+    except re.error as error:
+        logger.error('Failure during pattern compilation - {}'.format(str(error)))
+        raise SlotValidationError('Pattern could not be compiled.')
+
+def filter_values_by_pattern(values: List[Dict], pattern: str = None) -> List:
+    """
+    Returns the values which fully match the pattern, in order.
+    The values are matched in a batch: each distinct value is matched
+    once against the compiled pattern.
+
+    Only strings and numbers can match, numbers are matched by their
+    string form. Strings longer than PATTERN_MAX_VALUE_LENGTH never match.
+
+    :param values: list of dictionaries with entity_type and value keys
+    :param pattern: the regular expression the whole value must match
+    :return: list of the valid values
+    """
+    if not pattern:
+        # if no pattern is given, values are assumed to be valid
+        return [value_dict['value'] for value_dict in values]
+    fullmatch = compile_pattern(pattern).fullmatch
+    matched = {}
+    valid_value_list = []
+    for value_dict in values:
+        value = value_dict['value']
+        if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+            continue
+        text = value if isinstance(value, str) else str(value)
+        if text not in matched:
+            matched[text] = (
+                len(text) <= PATTERN_MAX_VALUE_LENGTH
+                and fullmatch(text) is not None
+            )
+        if matched[text]:
+            valid_value_list.append(value)
+    logger.info('{} of {} values matched the pattern'.format(len(valid_value_list), len(values)))
+    return valid_value_list
+
+def validate_pattern_entity(
+        values: List[Dict],
+        invalid_trigger: str = None,
+        key: str = None,
+        support_multiple: bool = True,
+        pick_first: bool = False,
+        pattern: str = None,
+        **kwargs
+    ) -> SlotValidationResult:
+    """
+    Validate an entity on the basis of its value extracted.
+    The method will check if the whole value matches the regular expression
+    given in pattern, e.g. PAN numbers, PIN codes or phone numbers.
+    If there is no pattern, it will simply assume the value is valid.
+
+    As in numeric validation, the values which do not match are filtered
+    out, and if even 1 value does not match the slot is assumed to be
+    partially filled.
+
+    :param pick_first: Set to true if the first value is to be picked up
+    :param support_multiple: Set to true if multiple utterances of an entity are supported
+        (has no usage here either, keeping it as per method definition)
+    :param values: Values extracted by NLU
+    :param invalid_trigger: Trigger to use if the extracted value is not supported
+    :param key: Dict key to use in the params returned
+    :param pattern: Regular expression the extracted values must fully match
+    :return: a tuple of (filled, partially_filled, trigger, params)
+    """
+    if not invalid_trigger:
+        # none or empty
+        logger.error('Invalid trigger is {}'.format(invalid_trigger))
+        raise SlotValidationError('No invalid trigger provided.')
+    if not key:
+        logger.error('Key is {}'.format(key))
+        raise SlotValidationError('No key provided.')
+    if not values:
+        # list is empty
+        return (False, False, invalid_trigger, {})
+    valid_value_list = filter_values_by_pattern(values, pattern)
+    return get_filtered_values_result(valid_value_list, values, invalid_trigger, key, pick_first)
+
+@lru_cache(maxsize=64)
+def get_timezone(name: str):
+    """
+    Timezone object for a name, built once per name
+
+    :param name: IANA timezone name, e.g. Asia/Kolkata
+    :return: a tzinfo object
+    """
+    timezone = tz.gettz(name)
+    if timezone is None:
+        logger.error('Unknown timezone - {}'.format(name))
+        raise SlotValidationError('Timezone {} is not known.'.format(name))
+    return timezone
+
+def parse_time_of_day(text: str) -> time:
+    """
+    :param text: time of the day as HH:MM
+    :return: a time object
+    """
+    try:
+        return datetime.strptime(text, '%H:%M').time()
+    except ValueError:
+        logger.error('Invalid time of day - {}'.format(text))
+        raise SlotValidationError('Time of day should be of the form HH:MM.')
+
+class DatetimeConstraint:
+    """
+    A datetime constraint resolved once per request: the timezone,
+    the reference time and the bounds of the window are computed
+    when it is built, so checking a value is only comparisons.
+
+    The constraint dictionary can have these keys, all optional:
+        timezone: IANA timezone name, naive values are taken to be in
+            it and the checks are done in it (default UTC)
+        start, end: bounds of the window (inclusive), either an ISO 8601
+            datetime or a time relative to the request: now, today
+            (midnight), optionally followed by an offset like +30d,
+            -2h, +15m or +1w, e.g. today+30d
+        weekdays: allowed days of the week, 0 is Monday
+        time_from, time_to: allowed time of the day as HH:MM, from is
+            inclusive and to exclusive. The window goes over midnight
+            if time_from is after time_to.
+    """
+
+    def __init__(self, constraint: Dict = None, now: datetime = None):
+        """
+        :param constraint: the constraint dictionary described above
+        :param now: the reference time, current time if not given
+        """
+        constraint = constraint or {}
+        self.tzinfo = get_timezone(constraint.get('timezone', 'UTC'))
+        self.now = (now or datetime.now(tz.UTC)).astimezone(self.tzinfo)
+        self.default = self.now.replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+        self.start = self.resolve_bound(constraint.get('start'))
+        self.end = self.resolve_bound(constraint.get('end'))
+        weekdays = constraint.get('weekdays')
+        self.weekdays = frozenset(weekdays) if weekdays is not None else None
+        self.time_from = parse_time_of_day(constraint['time_from']) if 'time_from' in constraint else None
+        self.time_to = parse_time_of_day(constraint['time_to']) if 'time_to' in constraint else None
+        # parsed values of this request
+        self.parsed_values = {}
+
+    def resolve_bound(self, bound: str) -> datetime:
+        """
+        :param bound: an ISO 8601 datetime or a relative time
+        :return: an aware datetime, None if bound is not given
+        """
+        if bound is None:
+            return None
+        match = RELATIVE_TIME_REGEX.match(bound)
+        if match and bound:
+            base, offset, unit = match.groups()
+            if base == 'today':
+                resolved = self.now.replace(hour=0, minute=0, second=0, microsecond=0)
             else:
-                params_list.append(v)
-        params = { key: params_list }
-    return (filled, partially_filled, trigger, params)
-    
+                resolved = self.now
+            if offset:
+                try:
+                    resolved += timedelta(**{RELATIVE_TIME_UNITS[unit]: int(offset)})
+                except (OverflowError, ValueError):
+                    logger.error('Out of range bound in datetime constraint - {}'.format(bound))
+                    raise SlotValidationError('Constraint bound {} is out of range.'.format(bound))
+            return resolved
+        resolved = self.parse(bound)
+        if resolved is None:
+            logger.error('Invalid bound in datetime constraint - {}'.format(bound))
+            raise SlotValidationError('Constraint bound {} could not be parsed.'.format(bound))
+        return resolved
 
+    def parse(self, value) -> datetime:
+        """
+        Parse a value into an aware datetime in the constraint timezone.
+        Strings are tried as ISO 8601 first, which is fast, then with
+        dateutil. Numbers are taken as unix timestamps.
 
+        :param value: value extracted by NLU
+        :return: an aware datetime, None if the value is not a datetime
+        """
+        if isinstance(value, bool):
+            return None
+        if isinstance(value, (int, float)):
+            try:
+                return datetime.fromtimestamp(value, self.tzinfo)
+            except (ValueError, OverflowError, OSError):
+                return None
+        if not isinstance(value, str):
+            return None
+        try:
+            parsed = datetime.fromisoformat(value)
+        except ValueError:
+            try:
+                # missing parts, like the date of 10:30, are taken
+                # from the reference time in the constraint timezone
+                parsed = dateutil_parser.parse(value, default=self.default)
+            except (ValueError, OverflowError):
+                return None
+        try:
+            if parsed.tzinfo is None:
+                return parsed.replace(tzinfo=self.tzinfo)
+            return parsed.astimezone(self.tzinfo)
+        except (ValueError, OverflowError):
+            # out of range once converted, near datetime.min or max
+            return None
 
+    def parse_cached(self, value) -> datetime:
+        """
+        Same as parse, each distinct value is parsed once per request
+        """
+        if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+            # bools are never datetimes, and True == 1 in the cache
+            return None
+        if value not in self.parsed_values:
+            self.parsed_values[value] = self.parse(value)
+        return self.parsed_values[value]
 
+    def is_satisfied(self, moment: datetime) -> bool:
+        """
+        :param moment: an aware datetime in the constraint timezone
+        :return: boolean, whether the datetime is in the window
+        """
+        if self.start is not None and moment < self.start:
+            return False
+        if self.end is not None and moment > self.end:
+            return False
+        if self.weekdays is not None and moment.weekday() not in self.weekdays:
+            return False
+        time_of_day = moment.time()
+        if self.time_from is not None and self.time_to is not None \
+                and self.time_from > self.time_to:
+            # window over midnight
+            return time_of_day >= self.time_from or time_of_day < self.time_to
+        if self.time_from is not None and time_of_day < self.time_from:
+            return False
+        if self.time_to is not None and time_of_day >= self.time_to:
+            return False
+        return True
 
+def validate_datetime_entity(
+        values: List[Dict],
+        invalid_trigger: str = None,
+        key: str = None,
+        support_multiple: bool = True,
+        pick_first: bool = False,
+        constraint: Dict = None,
+        **kwargs
+    ) -> SlotValidationResult:
+    """
+    Validate an entity on the basis of its value extracted.
+    The method will check if the value is a date/time which lies in the window given
+    by the constraint, e.g. within the next 30 days on weekdays in business hours.
+    If there is no constraint, it will only check that the value is a date/time.
+
+    As in numeric validation, the values which are not valid are filtered out, and
+    if even 1 value is not valid the slot is assumed to be partially filled. Valid
+    values are sent back as ISO 8601 strings in the timezone of the constraint.
 
-    
\ No newline at end of file
+    :param pick_first: Set to true if the first value is to be picked up
+    :param support_multiple: Set to true if multiple utterances of an entity are supported
+        (has no usage here either, keeping it as per method definition)
+    :param values: Values extracted by NLU
+    :param invalid_trigger: Trigger to use if the extracted value is not supported
+    :param key: Dict key to use in the params returned
+    :param constraint: Window the values must lie in, see DatetimeConstraint
+    :return: a tuple of (filled, partially_filled, trigger, params)
+    """
+    if not invalid_trigger:
+        # none or empty
+        logger.error('Invalid trigger is {}'.format(invalid_trigger))
+        raise SlotValidationError('No invalid trigger provided.')
+    if not key:
+        logger.error('Key is {}'.format(key))
+        raise SlotValidationError('No key provided.')
+    if not values:
+        # list is empty
+        return (False, False, invalid_trigger, {})
+    datetime_constraint = DatetimeConstraint(constraint)
+    valid_value_list = []
+    for value_dict in values:
+        moment = datetime_constraint.parse_cached(value_dict['value'])
+        if moment is not None and datetime_constraint.is_satisfied(moment):
+            valid_value_list.append(moment.isoformat())
+    return get_filtered_values_result(valid_value_list, values, invalid_trigger, key, pick_first)
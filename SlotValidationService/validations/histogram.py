@@ -0,0 +1,42 @@
+"""
+Latency histogram shared by the load generator and shadow mode.
+"""
+import math
+from collections import Counter
+
+
+class LatencyHistogram:
+    """
+    Log bucketed latency histogram with a relative error of about 1%,
+    so memory stays constant however long the run is
+    """
+    # ratio between the bounds of two consecutive buckets
+    GROWTH = 1.02
+
+    def __init__(self):
+        self.buckets = Counter()
+        self.count = 0
+        self.max = 0.0
+
+    def record(self, seconds: float) -> None:
+        micros = max(seconds * 1e6, 1.0)
+        self.buckets[int(math.log(micros, self.GROWTH))] += 1
+        self.count += 1
+        self.max = max(self.max, seconds)
+
+    def percentile(self, percent: float) -> float:
+        """
+        :param percent: the percentile, between 0 and 100
+        :return: upper bound of the bucket of that percentile, in seconds
+        """
+        if not self.count:
+            return 0.0
+        if percent >= 100:
+            return self.max
+        rank = math.ceil(self.count * percent / 100)
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(self.GROWTH ** (bucket + 1) / 1e6, self.max)
+        return self.max
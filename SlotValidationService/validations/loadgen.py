@@ -0,0 +1,230 @@
+"""
+Load generator which replays a corpus of validation payloads
+against a running instance of the service.
+
+The corpus is a JSON lines file, one request payload per line. The
+endpoint a payload is sent to is picked from its validation_parser key.
+
+Two modes are supported:
+    1. open loop: requests arrive at a fixed rate regardless of how
+       fast the service answers. Latency is measured from the time a
+       request was supposed to be sent, so queueing behind a slow
+       service is accounted for (corrected for coordinated omission).
+    2. closed loop: a fixed number of callers send requests back to back.
+"""
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Tuple
+
+from .histogram import LatencyHistogram
+
+# validation_parser of a payload -> path of the endpoint serving it
+ENDPOINTS = {
+    'finite_values_entity': '/validate/finite/',
+    'numeric_values_entity': '/validate/numeric/',
+    'pattern_values_entity': '/validate/pattern/',
+    'datetime_values_entity': '/validate/datetime/',
+}
+
+# percentiles shown in the report
+PERCENTILES = (50, 90, 99, 99.9, 100)
+
+def load_corpus(path: str) -> Dict[str, List[bytes]]:
+    """
+    Reads the corpus and groups the payloads by validation parser
+
+    :param path: path to a JSON lines file of request payloads
+    :return: a dictionary of validation parser to encoded payloads
+    """
+    corpus = defaultdict(list)
+    with open(path) as corpus_file:
+        for line_no, line in enumerate(corpus_file, 1):
+            if not line.strip():
+                continue
+            payload = json.loads(line)
+            parser = payload.get('validation_parser')
+            if parser not in ENDPOINTS:
+                raise ValueError('Line {} has an unknown validation_parser {}'.format(
+                    line_no, parser,
+                ))
+            corpus[parser].append(json.dumps(payload).encode())
+    if not corpus:
+        raise ValueError('Corpus {} has no payloads'.format(path))
+    return dict(corpus)
+
+class RequestMix:
+    """
+    Picks the next payload to be sent: the validation parser is chosen
+    by weight, then a payload of that parser is chosen uniformly
+    """
+
+    def __init__(self, corpus: Dict[str, List[bytes]], weights: Dict[str, float] = None):
+        """
+        :param corpus: the payloads grouped by validation parser
+        :param weights: relative weight of each validation parser, parsers
+            not mentioned get a weight of 0. All parsers in the corpus
+            have equal weight if not given.
+        """
+        weights = weights or {parser: 1 for parser in corpus}
+        unknown = set(weights) - set(corpus)
+        if unknown:
+            raise ValueError('No payloads in the corpus for {}'.format(', '.join(sorted(unknown))))
+        self.parsers = [parser for parser in weights if weights[parser] > 0]
+        if not self.parsers:
+            raise ValueError('At least one weight should be positive')
+        self.weights = [weights[parser] for parser in self.parsers]
+        self.corpus = corpus
+
+    def pick(self) -> Tuple[str, bytes]:
+        """
+        :return: a tuple of (validation parser, payload)
+        """
+        parser = random.choices(self.parsers, self.weights)[0]
+        return parser, random.choice(self.corpus[parser])
+
+class LoadStats:
+    """
+    Thread safe accumulator of the outcome of each request
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histogram = LatencyHistogram()
+        self.per_parser = defaultdict(LatencyHistogram)
+        self.errors = Counter()
+        self.started = time.monotonic()
+        self.finished = None
+
+    def record(self, parser: str, latency: float, error: str = None) -> None:
+        with self.lock:
+            self.histogram.record(latency)
+            self.per_parser[parser].record(latency)
+            if error is not None:
+                self.errors[error] += 1
+
+    def report(self) -> str:
+        """
+        :return: human readable summary of the run
+        """
+        elapsed = (self.finished or time.monotonic()) - self.started
+        total = self.histogram.count
+        lines = [
+            'Requests: {}  Duration: {:.2f}s  Throughput: {:.1f} req/s  Errors: {}'.format(
+                total, elapsed, total / elapsed if elapsed else 0.0, sum(self.errors.values()),
+            ),
+            '',
+            '{:<24}{:>10}'.format('latency (ms)', 'count') + ''.join(
+                '{:>10}'.format('p{:g}'.format(p) if p < 100 else 'max') for p in PERCENTILES
+            ),
+        ]
+        rows = [('all', self.histogram)] + sorted(self.per_parser.items())
+        for name, histogram in rows:
+            lines.append('{:<24}{:>10}'.format(name, histogram.count) + ''.join(
+                '{:>10.2f}'.format(histogram.percentile(p) * 1e3) for p in PERCENTILES
+            ))
+        if self.errors:
+            lines += ['', 'Errors:']
+            for message, count in self.errors.most_common():
+                lines.append('{:>10}  {}'.format(count, message))
+        return '\n'.join(lines)
+
+def send(url: str, body: bytes, timeout: float) -> str:
+    """
+    POST a payload to the service
+
+    :param url: full url of the endpoint
+    :param body: encoded JSON payload
+    :param timeout: socket timeout in seconds
+    :return: None on success, otherwise a description of the error.
+        For error responses of the service it is the message of the
+        SlotValidationError (or validation failure) sent back.
+    """
+    request = urllib.request.Request(
+        url, data=body, headers={'Content-Type': 'application/json'}, method='POST',
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+    except urllib.error.HTTPError as error:
+        try:
+            message = json.loads(error.read())['message']
+        except Exception:
+            message = error.reason
+        return '{} {}'.format(error.code, message)
+    except Exception as error:
+        return type(error).__name__
+    return None
+
+class LoadGenerator:
+    """
+    Drives the service with payloads from a RequestMix
+    """
+
+    def __init__(self, base_url: str, mix: RequestMix, timeout: float = 10.0):
+        self.base_url = base_url.rstrip('/')
+        self.mix = mix
+        self.timeout = timeout
+
+    def fire(self, stats: LoadStats, intended_start: float = None) -> None:
+        """
+        Send one request and record its outcome
+
+        :param stats: where the outcome is recorded
+        :param intended_start: time at which the request was scheduled,
+            latency is measured from here when given
+        """
+        parser, body = self.mix.pick()
+        start = time.monotonic() if intended_start is None else intended_start
+        error = send(self.base_url + ENDPOINTS[parser], body, self.timeout)
+        stats.record(parser, time.monotonic() - start, error)
+
+    def run_open_loop(self, rate: float, duration: float, max_workers: int = 256) -> LoadStats:
+        """
+        Send requests at a fixed arrival rate
+
+        :param rate: requests per second
+        :param duration: length of the run in seconds
+        :param max_workers: maximum number of requests in flight, requests
+            beyond it wait for a free worker and that wait counts in
+            their latency
+        :return: stats of the run
+        """
+        stats = LoadStats()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for i in range(int(rate * duration)):
+                intended_start = stats.started + i / rate
+                delay = intended_start - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(self.fire, stats, intended_start)
+        stats.finished = time.monotonic()
+        return stats
+
+    def run_closed_loop(self, concurrency: int, duration: float) -> LoadStats:
+        """
+        Send requests back to back from a fixed number of callers
+
+        :param concurrency: number of callers
+        :param duration: length of the run in seconds
+        :return: stats of the run
+        """
+        stats = LoadStats()
+        deadline = stats.started + duration
+
+        def caller():
+            while time.monotonic() < deadline:
+                self.fire(stats)
+
+        callers = [threading.Thread(target=caller, daemon=True) for _ in range(concurrency)]
+        for thread in callers:
+            thread.start()
+        for thread in callers:
+            thread.join()
+        stats.finished = time.monotonic()
+        return stats
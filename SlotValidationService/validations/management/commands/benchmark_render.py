@@ -0,0 +1,81 @@
+"""
+Management command to compare the response fast path of
+validations/renderers.py with the DRF Response and JSONRenderer
+
+python manage.py benchmark_render --number 20000
+"""
+import json
+import timeit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from rest_framework.renderers import JSONRenderer
+
+from validations import renderers
+from validations.views import FiniteValuesValidationView
+
+BASE_PAYLOAD = {
+    'invalid_trigger': 'invalid_ids_stated',
+    'key': 'ids_stated',
+    'name': 'govt_id',
+    'reuse': True,
+    'support_multiple': False,
+    'pick_first': True,
+    'supported_values': ['pan', 'aadhaar', 'college', 'corporate', 'dl', 'voter', 'passport', 'local'],
+    'type': ['id'],
+    'validation_parser': 'finite_values_entity',
+    'values': [],
+}
+
+# name -> values of the payload
+CASES = {
+    'empty_values': [],
+    'all_invalid': [{'entity_type': 'id', 'value': 'other'}, {'entity_type': 'id', 'value': 'none'}],
+    'pick_first': [{'entity_type': 'id', 'value': 'college'}, {'entity_type': 'id', 'value': 'pan'}],
+}
+
+class Command(BaseCommand):
+    help = 'Benchmark the response fast path against the DRF render pipeline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--number', type=int, default=20000, help='iterations per measurement')
+
+    def per_call(self, func, number):
+        """
+        :return: best of 3 time per call, in microseconds
+        """
+        return min(timeit.repeat(func, number=number, repeat=3)) / number * 1e6
+
+    def handle(self, *args, **options):
+        number = options['number']
+        view = FiniteValuesValidationView()
+        factory = RequestFactory()
+        fast_path = settings.RESPONSE_FAST_PATH
+        self.stdout.write('{:<16}{:>14}{:>14}{:>18}{:>18}'.format(
+            'case (us/call)', 'render drf', 'render fast', 'request drf', 'request fast',
+        ))
+        for name, values in CASES.items():
+            payload = dict(BASE_PAYLOAD, values=values)
+            validation_tuple = view.validate_slots(payload)
+            body = json.dumps(payload)
+
+            def request():
+                response = FiniteValuesValidationView.as_view()(
+                    factory.post('/validate/finite/', body, content_type='application/json'),
+                )
+                if hasattr(response, 'render'):
+                    # DRF responses are rendered lazily
+                    response.render()
+
+            timings = [
+                self.per_call(lambda: JSONRenderer().render(
+                    view.create_dict_from_validation_tuple(validation_tuple),
+                ), number),
+                self.per_call(lambda: renderers.render_validation_result(validation_tuple), number),
+            ]
+            for enabled in (False, True):
+                settings.RESPONSE_FAST_PATH = enabled
+                timings.append(self.per_call(request, max(number // 20, 1)))
+            settings.RESPONSE_FAST_PATH = fast_path
+            self.stdout.write('{:<16}{:>14.2f}{:>14.2f}{:>18.1f}{:>18.1f}'.format(name, *timings))
@@ -0,0 +1,57 @@
+"""
+Management command to replay a corpus of payloads against the service,
+see validations/loadgen.py
+
+python manage.py loadtest corpus.jsonl --rate 200 --duration 60
+python manage.py loadtest corpus.jsonl --concurrency 16 --weight finite_values_entity=3
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from validations import loadgen
+
+class Command(BaseCommand):
+    help = 'Replay a JSON lines corpus of validation payloads and report latency, throughput and errors'
+
+    def add_arguments(self, parser):
+        parser.add_argument('corpus', help='JSON lines file, one request payload per line')
+        parser.add_argument('--url', default='http://localhost:8000', help='base url of the service')
+        mode = parser.add_mutually_exclusive_group(required=True)
+        mode.add_argument('--rate', type=float, help='open loop: arrival rate in requests per second')
+        mode.add_argument('--concurrency', type=int, help='closed loop: number of concurrent callers')
+        parser.add_argument('--duration', type=float, default=30.0, help='length of the run in seconds')
+        parser.add_argument(
+            '--weight', action='append', default=[], metavar='PARSER=WEIGHT',
+            help='relative weight of a validation parser in the mix, can be repeated',
+        )
+        parser.add_argument('--timeout', type=float, default=10.0, help='per request timeout in seconds')
+        parser.add_argument(
+            '--max-workers', type=int, default=256,
+            help='open loop: maximum number of requests in flight',
+        )
+
+    def parse_weights(self, weights):
+        parsed = {}
+        for weight in weights:
+            parser, _, value = weight.partition('=')
+            try:
+                parsed[parser] = float(value)
+            except ValueError:
+                raise CommandError('Weight should be of the form PARSER=WEIGHT, got {}'.format(weight))
+        return parsed
+
+    def handle(self, *args, **options):
+        if options['rate'] is not None and not options['rate'] > 0:
+            raise CommandError('--rate should be positive, got {}'.format(options['rate']))
+        if options['concurrency'] is not None and options['concurrency'] <= 0:
+            raise CommandError('--concurrency should be positive, got {}'.format(options['concurrency']))
+        try:
+            corpus = loadgen.load_corpus(options['corpus'])
+            mix = loadgen.RequestMix(corpus, self.parse_weights(options['weight']))
+        except (OSError, ValueError) as error:
+            raise CommandError(str(error))
+        generator = loadgen.LoadGenerator(options['url'], mix, options['timeout'])
+        if options['rate'] is not None:
+            stats = generator.run_open_loop(options['rate'], options['duration'], options['max_workers'])
+        else:
+            stats = generator.run_closed_loop(options['concurrency'], options['duration'])
+        self.stdout.write(stats.report())
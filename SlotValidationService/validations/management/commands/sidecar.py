@@ -0,0 +1,32 @@
+"""
+Management command to run the Unix domain socket sidecar server,
+see validations/sidecar.py
+
+python manage.py sidecar --socket /tmp/slot-validation.sock
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from validations.sidecar import SidecarServer
+
+class Command(BaseCommand):
+    help = 'Serve validation requests over a Unix domain socket for callers on the same host'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--socket', default=settings.SIDECAR_SOCKET_PATH,
+            help='path of the Unix domain socket to listen on',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            server = SidecarServer(options['socket'])
+        except OSError as error:
+            raise CommandError(str(error))
+        self.stdout.write('Sidecar listening on {}'.format(options['socket']))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
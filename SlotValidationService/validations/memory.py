@@ -0,0 +1,177 @@
+"""
+Optional memory accounting of the validation requests.
+
+A MEMORY_SAMPLE_RATE fraction of the requests is traced with
+tracemalloc, one request at a time. Tracing is started for the
+request and stopped after it, so nothing is paid for the requests
+which are not sampled. For a traced request the peak allocation of
+each phase is recorded:
+    decode: reading the body and decoding the JSON (DRF)
+    schema: jsonschema and the custom validation rules
+    engine: the engine validation method
+and a snapshot is taken at the end of the engine phase, while the
+request data and the result are still alive, to find the largest
+allocation sites. Allocations of other threads during the request are
+counted too, so the numbers are an upper bound under concurrency.
+
+MEMORY_BUDGET_BYTES rejects a request with a 413 before its body is
+even read when its size times MEMORY_EXPANSION_FACTOR (the bytes
+allocated per byte of body, which can be calibrated from the
+max_peak_per_body_byte reported here) is over the budget.
+"""
+import logging
+import random
+import threading
+import tracemalloc
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Dict
+
+from django.conf import settings
+from rest_framework import status
+
+from .slot_validation_error import SlotValidationError
+
+logger = logging.getLogger(__name__)
+
+# phase at the end of which the snapshot of allocation sites is taken
+SNAPSHOT_PHASE = 'engine'
+# number of traced requests kept in full
+RECENT_TRACES = 20
+
+# only one request is traced at a time as tracemalloc is process wide
+_trace_lock = threading.Lock()
+_local = threading.local()
+
+class MemoryStats:
+    """
+    Aggregated memory accounting of the traced requests
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = Counter()
+        self.phase_max = Counter()
+        self.phase_total = Counter()
+        self.max_peak_per_body_byte = 0.0
+        # allocation site -> largest size seen in a snapshot
+        self.sites = {}
+        self.recent = deque(maxlen=RECENT_TRACES)
+
+    def record(self, body_bytes: int, phases: Dict[str, int], sites: Dict[str, int]) -> None:
+        with self.lock:
+            self.counters['traced'] += 1
+            for phase, peak in phases.items():
+                self.phase_max[phase] = max(self.phase_max[phase], peak)
+                self.phase_total[phase] += peak
+            if body_bytes and phases:
+                self.max_peak_per_body_byte = max(
+                    self.max_peak_per_body_byte, max(phases.values()) / body_bytes,
+                )
+            for site, size in sites.items():
+                self.sites[site] = max(self.sites.get(site, 0), size)
+            top_sites = sorted(self.sites.items(), key=lambda item: -item[1])
+            self.sites = dict(top_sites[:settings.MEMORY_TOP_SITES])
+            self.recent.append({'body_bytes': body_bytes, 'phase_peak_bytes': phases})
+
+    def snapshot(self) -> Dict:
+        """
+        :return: aggregated stats, for the memory endpoint
+        """
+        with self.lock:
+            traced = self.counters['traced']
+            return {
+                'sample_rate': settings.MEMORY_SAMPLE_RATE,
+                'budget_bytes': settings.MEMORY_BUDGET_BYTES,
+                'traced': traced,
+                'rejected_over_budget': self.counters['rejected'],
+                'phase_peak_bytes': {
+                    phase: {
+                        'max': self.phase_max[phase],
+                        'mean': self.phase_total[phase] / traced,
+                    }
+                    for phase in self.phase_max
+                },
+                'max_peak_per_body_byte': self.max_peak_per_body_byte,
+                'largest_sites': [
+                    {'site': site, 'bytes': size}
+                    for site, size in sorted(self.sites.items(), key=lambda item: -item[1])
+                ],
+                'recent': list(self.recent),
+            }
+
+stats = MemoryStats()
+
+def check_budget(body_bytes: int) -> None:
+    """
+    Raise SlotValidationError (413) if the estimated memory of the
+    request is over MEMORY_BUDGET_BYTES
+
+    :param body_bytes: size of the request body
+    """
+    budget = settings.MEMORY_BUDGET_BYTES
+    if budget is None or body_bytes * settings.MEMORY_EXPANSION_FACTOR <= budget:
+        return
+    with stats.lock:
+        stats.counters['rejected'] += 1
+    logger.error('Request of {} bytes is over the memory budget'.format(body_bytes))
+    raise SlotValidationError(
+        'Request is over the memory budget.',
+        status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+    )
+
+@contextmanager
+def trace(body_bytes: int):
+    """
+    Trace the memory of the request run in the block if it is sampled
+    and no other request is being traced
+
+    :param body_bytes: size of the request body
+    """
+    if random.random() >= settings.MEMORY_SAMPLE_RATE or not _trace_lock.acquire(blocking=False):
+        yield
+        return
+    _local.phases = {}
+    _local.sites = {}
+    tracemalloc.start(settings.MEMORY_TRACE_FRAMES)
+    try:
+        yield
+    finally:
+        tracemalloc.stop()
+        phases, sites = _local.phases, _local.sites
+        _local.phases = None
+        _trace_lock.release()
+        stats.record(body_bytes, phases, sites)
+
+@contextmanager
+def phase(name: str):
+    """
+    Record the peak allocation of the block as the given phase
+    of the request being traced in this thread, if any
+
+    :param name: name of the phase
+    """
+    phases = getattr(_local, 'phases', None)
+    if phases is None:
+        yield
+        return
+    if hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+    else:
+        # python < 3.9, clearing the traces resets the peak as well. The
+        # allocations of the earlier phases are then not in the snapshot.
+        tracemalloc.clear_traces()
+        baseline = 0
+    try:
+        yield
+    finally:
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+        phases[name] = max(phases.get(name, 0), peak)
+        if name == SNAPSHOT_PHASE:
+            snapshot = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+            ))
+            for statistic in snapshot.statistics('lineno')[:settings.MEMORY_TOP_SITES]:
+                frame = statistic.traceback[0]
+                _local.sites['{}:{}'.format(frame.filename, frame.lineno)] = statistic.size
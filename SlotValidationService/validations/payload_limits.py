@@ -0,0 +1,98 @@
+"""
+Limits on request payloads, checked before the expensive part of
+request parsing (jsonschema validation and the custom rules).
+
+The size of the body is enforced while it is read: it is read in
+chunks and reading stops as soon as the limit is crossed, so an
+oversized body is never read completely nor decoded.
+
+The number of items of values and supported_values and the nesting
+depth are checked right after decoding. Following the structure of the
+JSON while streaming it would need a tokenizer in python, which is
+several times slower than decoding with the C decoder of the json
+module, and the decoder only ever sees bodies under the size limit.
+"""
+from django.conf import settings
+
+class PayloadLimitError(Exception):
+    """
+    Raised when the payload is over one of the limits
+    """
+
+def get_content_length(request) -> int:
+    """
+    :param request: the http request object
+    :return: the Content-Length announced by the client, 0 if it is
+        missing or malformed like Django and DRF do
+    """
+    try:
+        return max(int(request.META.get('CONTENT_LENGTH') or 0), 0)
+    except (ValueError, TypeError):
+        return 0
+
+def read_body(stream, content_length: int = 0) -> bytes:
+    """
+    Read the body in chunks, stopping as soon as it is over
+    PAYLOAD_MAX_BODY_BYTES
+
+    :param stream: incoming data body
+    :param content_length: size announced by the client, checked
+        before reading anything
+    :return: the body
+    """
+    max_body_bytes = settings.PAYLOAD_MAX_BODY_BYTES
+    error = PayloadLimitError('Request body cannot be larger than {} bytes.'.format(max_body_bytes))
+    if max_body_bytes is not None and content_length > max_body_bytes:
+        raise error
+    chunks = []
+    body_bytes = 0
+    while True:
+        chunk = stream.read(settings.PAYLOAD_READ_CHUNK_BYTES)
+        if not chunk:
+            break
+        body_bytes += len(chunk)
+        if max_body_bytes is not None and body_bytes > max_body_bytes:
+            raise error
+        chunks.append(chunk)
+    return b''.join(chunks)
+
+def check_depth(data, max_depth: int) -> None:
+    """
+    Raise PayloadLimitError if lists and dictionaries are nested
+    deeper than max_depth, the top level being 1. Stops at the first
+    container over the limit.
+
+    :param data: the decoded payload
+    :param max_depth: maximum nesting depth
+    """
+    stack = [(data, 1)]
+    while stack:
+        node, depth = stack.pop()
+        children = node.values() if isinstance(node, dict) else node
+        for child in children:
+            if isinstance(child, (dict, list)):
+                if depth + 1 > max_depth:
+                    raise PayloadLimitError('JSON nesting cannot be deeper than {}.'.format(max_depth))
+                stack.append((child, depth + 1))
+
+def check_structure(data) -> None:
+    """
+    Raise PayloadLimitError if the decoded payload is over the
+    PAYLOAD_MAX_VALUES, PAYLOAD_MAX_SUPPORTED_VALUES or
+    PAYLOAD_MAX_DEPTH limits
+
+    :param data: the decoded payload
+    """
+    if not isinstance(data, (dict, list)):
+        return
+    if isinstance(data, dict):
+        max_items = {
+            'values': settings.PAYLOAD_MAX_VALUES,
+            'supported_values': settings.PAYLOAD_MAX_SUPPORTED_VALUES,
+        }
+        for key, limit in max_items.items():
+            items = data.get(key)
+            if limit is not None and isinstance(items, list) and len(items) > limit:
+                raise PayloadLimitError('{} cannot have more than {} items.'.format(key, limit))
+    if settings.PAYLOAD_MAX_DEPTH is not None:
+        check_depth(data, settings.PAYLOAD_MAX_DEPTH)
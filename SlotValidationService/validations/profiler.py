@@ -0,0 +1,118 @@
+"""
+On-demand sampling profiler for live workers.
+
+Nothing runs while the profiler is idle. When a profile is requested
+the calling thread samples the stacks of every other thread in the
+process at a fixed interval for a bounded window, and the samples are
+aggregated in collapsed flame graph format, i.e. one line per distinct
+stack:
+
+    <thread>;<outermost frame>;...;<innermost frame> <sample count>
+
+which can be fed directly to flamegraph.pl or speedscope.
+"""
+import logging
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict
+
+from django.conf import settings
+from rest_framework import status
+
+from .slot_validation_error import SlotValidationError
+
+logger = logging.getLogger(__name__)
+
+# only one profile can run in a worker at a time
+_profile_lock = threading.Lock()
+
+def format_frame(frame) -> str:
+    """
+    Label used for a frame in the collapsed output, of the form
+    <module>:<function>
+
+    :param frame: a python frame object
+    :return: label of the frame
+    """
+    module = frame.f_globals.get('__name__', '?')
+    return '{}:{}'.format(module, frame.f_code.co_name)
+
+def collapse_stack(thread_name: str, frame) -> str:
+    """
+    Walks a frame up to the root and returns the stack as a single
+    semicolon separated string, outermost frame first
+
+    :param thread_name: name of the thread the frame belongs to
+    :param frame: innermost frame of the stack
+    :return: the collapsed stack
+    """
+    labels = []
+    while frame is not None:
+        labels.append(format_frame(frame))
+        frame = frame.f_back
+    labels.append(thread_name)
+    labels.reverse()
+    return ';'.join(labels)
+
+def take_sample(stacks: Counter, own_ident: int) -> None:
+    """
+    Records the current stack of every thread except the
+    profiling thread itself
+
+    :param stacks: counter of collapsed stacks to be updated
+    :param own_ident: ident of the profiling thread
+    """
+    thread_names = {t.ident: t.name for t in threading.enumerate()}
+    for ident, frame in sys._current_frames().items():
+        if ident == own_ident:
+            continue
+        stacks[collapse_stack(thread_names.get(ident, str(ident)), frame)] += 1
+
+def format_collapsed(stacks: Dict[str, int]) -> str:
+    """
+    Render aggregated stacks in collapsed flame graph format
+
+    :param stacks: mapping of collapsed stack to sample count
+    :return: one line per stack, heaviest stacks first
+    """
+    lines = [
+        '{} {}'.format(stack, count)
+        for stack, count in sorted(stacks.items(), key=lambda item: -item[1])
+    ]
+    return '\n'.join(lines) + '\n' if lines else ''
+
+def profile(seconds: float, interval: float) -> str:
+    """
+    Sample all threads of this worker for a bounded window. Blocks
+    the calling thread for the duration of the window.
+
+    :param seconds: length of the sampling window
+    :param interval: time between two samples
+    :return: aggregated stacks in collapsed flame graph format
+    """
+    if not 0 < seconds <= settings.PROFILER_MAX_SECONDS:
+        raise SlotValidationError(
+            'seconds should be in (0, {}].'.format(settings.PROFILER_MAX_SECONDS),
+            status.HTTP_400_BAD_REQUEST,
+        )
+    if not settings.PROFILER_MIN_INTERVAL <= interval <= seconds:
+        raise SlotValidationError(
+            'interval should be in [{}, seconds].'.format(settings.PROFILER_MIN_INTERVAL),
+            status.HTTP_400_BAD_REQUEST,
+        )
+    if not _profile_lock.acquire(blocking=False):
+        raise SlotValidationError('A profile is already running.', status.HTTP_409_CONFLICT)
+    try:
+        logger.info('Profiling for {}s every {}s'.format(seconds, interval))
+        stacks = Counter()
+        own_ident = threading.get_ident()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            take_sample(stacks, own_ident)
+            time.sleep(max(0, min(interval, deadline - time.monotonic())))
+    finally:
+        _profile_lock.release()
+    logger.info('Profile collected {} samples'.format(sum(stacks.values())))
+    return format_collapsed(stacks)
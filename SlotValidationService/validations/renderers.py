@@ -0,0 +1,97 @@
+"""
+Fast path to render the result of a validation into response bytes.
+
+Responses of the validation endpoints all have the same shape, and most
+of them are one of a few, like an invalid trigger with empty parameters.
+So instead of building a dictionary and sending it through the generic
+DRF Response and JSONRenderer, the bytes are put together from cached
+templates: the whole body is cached for results with empty parameters,
+and otherwise only the parameters are encoded. The output is the same
+as JSONRenderer's, with the same encoder and settings.
+"""
+import json
+from functools import lru_cache
+
+from django.http import HttpResponse
+from rest_framework.renderers import JSONRenderer
+
+from .engine import SlotValidationResult
+
+ENCODER_OPTIONS = {
+    'cls': JSONRenderer.encoder_class,
+    'ensure_ascii': JSONRenderer.ensure_ascii,
+    'allow_nan': not JSONRenderer.strict,
+    'separators': (',', ':') if JSONRenderer.compact else (', ', ': '),
+}
+
+# start of the body for each (filled, partially_filled)
+PREFIXES = {
+    (filled, partially_filled): '{{"filled":{},"partially_filled":{},"trigger":'.format(
+        json.dumps(filled), json.dumps(partially_filled),
+    ).encode()
+    for filled in (True, False)
+    for partially_filled in (True, False)
+}
+PARAMETERS_KEY = b',"parameters":'
+
+def encode(data) -> bytes:
+    """
+    Encode data the same way JSONRenderer does
+
+    :param data: any JSON serializable data
+    :return: the JSON bytes
+    """
+    text = json.dumps(data, **ENCODER_OPTIONS)
+    # JSONRenderer escapes these to output a strict javascript subset
+    return text.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029').encode()
+
+@lru_cache(maxsize=1024)
+def render_head(filled: bool, partially_filled: bool, trigger: str) -> bytes:
+    """
+    Body up to the value of parameters, cached as there are only
+    a few triggers
+
+    :return: the head of the body
+    """
+    return PREFIXES[(bool(filled), bool(partially_filled))] + encode(trigger) + PARAMETERS_KEY
+
+@lru_cache(maxsize=1024)
+def render_empty(filled: bool, partially_filled: bool, trigger: str) -> bytes:
+    """
+    Whole body of a result with empty parameters, the most common case
+
+    :return: the body
+    """
+    return render_head(filled, partially_filled, trigger) + b'{}}'
+
+def render_validation_result(validation_tuple: SlotValidationResult) -> bytes:
+    """
+    Render the tuple retrieved from the engine into the same bytes as
+    JSONRenderer would for the dictionary of create_dict_from_validation_tuple
+
+    :param validation_tuple: a tuple of (filled, partially_filled, trigger, params)
+    :return: the response body
+    """
+    filled, partially_filled, trigger, params = validation_tuple
+    if not isinstance(filled, bool) or not isinstance(partially_filled, bool) \
+            or not isinstance(trigger, str):
+        # not one of the known shapes
+        return JSONRenderer().render({
+            'filled': filled,
+            'partially_filled': partially_filled,
+            'trigger': trigger,
+            'parameters': params,
+        })
+    if isinstance(params, dict) and not params:
+        return render_empty(filled, partially_filled, trigger)
+    return render_head(filled, partially_filled, trigger) + encode(params) + b'}'
+
+def validation_result_response(validation_tuple: SlotValidationResult) -> HttpResponse:
+    """
+    :param validation_tuple: a tuple of (filled, partially_filled, trigger, params)
+    :return: a response with the rendered body
+    """
+    return HttpResponse(
+        render_validation_result(validation_tuple),
+        content_type=JSONRenderer.media_type,
+    )
@@ -4,30 +4,141 @@ Parsers for JSON validation for API request payloads
 Creates a custom content negotiator to allow only server to set
 content types in the API
 """
+import io
 import logging
 import jsonschema
 import ast
+import re
+from functools import lru_cache
+try:
+    from re import _parser as sre_parse
+    from re import _constants as sre_constants
+except ImportError:
+    # python < 3.11
+    import sre_parse
+    import sre_constants
 from rest_framework.exceptions import ValidationError
 from rest_framework import parsers
 from rest_framework import negotiation
 
 from . import schemas
+from . import memory
+from . import payload_limits
+from .payload_limits import PayloadLimitError
+from .engine import DatetimeConstraint, PATTERN_CACHE_SIZE
+from .slot_validation_error import SlotValidationError
 
 logger = logging.getLogger(__name__)
 
-class FiniteValidationJsonParser(parsers.JSONParser):
+# characters matched by parts of a pattern, for the backtracking check
+# of pattern validation: ascii characters by their code, the others
+# grouped by the classes of \d, \w and \s they belong to
+NON_ASCII_DIGIT = -1
+NON_ASCII_WORD = -2
+NON_ASCII_SPACE = -3
+NON_ASCII_OTHER = -4
+ASCII_CHARS = frozenset(range(128))
+NON_ASCII_CHARS = frozenset({NON_ASCII_DIGIT, NON_ASCII_WORD, NON_ASCII_SPACE, NON_ASCII_OTHER})
+ALL_CHARS = ASCII_CHARS | NON_ASCII_CHARS
+
+def get_char_code(char: str) -> int:
     """
-    Custom parser to parse request JSON according to
-    schema for finite validation defined in schema
-    module
+    :param char: a character
+    :return: its code if it is ascii, otherwise its group
+    """
+    if ord(char) in ASCII_CHARS:
+        return ord(char)
+    if char.isdecimal():
+        return NON_ASCII_DIGIT
+    if char.isalnum():
+        return NON_ASCII_WORD
+    if char.isspace():
+        return NON_ASCII_SPACE
+    return NON_ASCII_OTHER
+
+_DIGIT_CHARS = frozenset(code for code in ASCII_CHARS if chr(code).isdecimal()) | {NON_ASCII_DIGIT}
+_WORD_CHARS = frozenset(
+    code for code in ASCII_CHARS if chr(code).isalnum() or chr(code) == '_'
+) | {NON_ASCII_DIGIT, NON_ASCII_WORD}
+_SPACE_CHARS = frozenset(code for code in ASCII_CHARS if chr(code).isspace()) | {NON_ASCII_SPACE}
+_LINEBREAK_CHARS = frozenset({ord('\n')})
+CATEGORY_CHARS = {
+    sre_constants.CATEGORY_DIGIT: _DIGIT_CHARS,
+    sre_constants.CATEGORY_NOT_DIGIT: ALL_CHARS - _DIGIT_CHARS,
+    sre_constants.CATEGORY_WORD: _WORD_CHARS,
+    sre_constants.CATEGORY_NOT_WORD: ALL_CHARS - _WORD_CHARS,
+    sre_constants.CATEGORY_SPACE: _SPACE_CHARS,
+    sre_constants.CATEGORY_NOT_SPACE: ALL_CHARS - _SPACE_CHARS,
+    sre_constants.CATEGORY_LINEBREAK: _LINEBREAK_CHARS,
+    sre_constants.CATEGORY_NOT_LINEBREAK: ALL_CHARS - _LINEBREAK_CHARS,
+}
+
+class LimitedJsonParser(parsers.JSONParser):
+    """
+    JSON parser which enforces the payload limits set in settings
+    (PAYLOAD_*): the body size while reading the body, then the number
+    of items and the nesting depth right after decoding it, so that
+    payloads over the limits never reach the schema validation
     """
-    JSON_SCHEMA = schemas.finite_values_json
+
+    def early_validation(self, data):
+        """
+        Cheap checks on the decoded data, run before the schema
+        validation. Raise error if validation fails.
+
+        :param data: decoded request json
+        """
+
+    def validate(self, data):
+        """
+        Validate the decoded payload against the schema and the
+        custom rules, overridden by each parser. Raise error if
+        validation fails.
+
+        :param data: decoded request json
+        """
+
+    def decode(self, stream, media_type=None, parser_context=None):
+        """
+        Read the body within the limits and decode it with
+        the JSON parser of DRF
+
+        :param stream: incoming data body
+        :param media_type: media type of request
+        :param parser_context: to give extra context for parsing
+            if required
+        :return: the decoded data
+        """
+        request = (parser_context or {}).get('request')
+        content_length = payload_limits.get_content_length(request) if request is not None else 0
+        try:
+            body = payload_limits.read_body(stream, content_length)
+        except PayloadLimitError as error:
+            logger.error('Payload over the limits - {}'.format(error))
+            raise ValidationError(detail=str(error))
+        try:
+            data = super(LimitedJsonParser, self).parse(
+                io.BytesIO(body), media_type, parser_context,
+            )
+        except RecursionError:
+            logger.error('Payload nested too deep to be decoded')
+            raise ValidationError(detail='JSON nesting is too deep.')
+        if not isinstance(data, dict):
+            # the schemas only constrain objects
+            logger.error('Payload is a {}, not an object'.format(type(data).__name__))
+            raise ValidationError(detail='JSON validation failed. Check logs...')
+        try:
+            payload_limits.check_structure(data)
+        except PayloadLimitError as error:
+            logger.error('Payload over the limits - {}'.format(error))
+            raise ValidationError(detail=str(error))
+        return data
 
     def parse(self, stream, media_type=None, parser_context=None):
         """
         Override the parse method to validate using the schema
-        as well. Refer to this for more info: 
-        
+        as well. Refer to this for more info:
+
         https://www.django-rest-framework.org/api-guide/parsers/#custom-parsers
 
         :param stream: incoming data body
@@ -36,26 +147,68 @@ class FiniteValidationJsonParser(parsers.JSONParser):
             if required
         :return: dictionary of request data, if valid
         """
-        data = super(FiniteValidationJsonParser, self).parse(
-            stream, media_type, parser_context,
-        )
+        with memory.phase('decode'):
+            data = self.decode(stream, media_type, parser_context)
+            self.early_validation(data)
+        with memory.phase('schema'):
+            self.validate(data)
+        return data
+
+
+class FiniteValidationJsonParser(LimitedJsonParser):
+    """
+    Custom parser to parse request JSON according to
+    schema for finite validation defined in schema
+    module
+    """
+    JSON_SCHEMA = schemas.finite_values_json
+
+    def validate(self, data):
+        """
+        Validate the decoded payload against the schema and the
+        custom rules. Raise error if validation fails.
+
+        :param data: decoded request json
+        """
         # validate the json using the schema
         try:
             jsonschema.validate(data, self.JSON_SCHEMA)
         except Exception as error:
             logger.error('Error while validating the json - {}'.format(error))
             raise ValidationError(detail='JSON validation failed. Check logs...')
-        if data['pick_first'] == data['support_multiple']:
+        self.multiplicity_validation(data['pick_first'], data['support_multiple'])
+
+    def multiplicity_validation(self, pick_first, support_multiple):
+        """
+        Validate that pick_first and support_multiple are not equal.
+        Raise error if validation fails.
+
+        :param pick_first: pick_first of the request
+        :param support_multiple: support_multiple of the request
+        """
+        if pick_first == support_multiple:
             # both being equal makes no sense
-            logger.error('Both pick_first and support_multiple are {}'.format(data['pick_first']))
+            logger.error('Both pick_first and support_multiple are {}'.format(pick_first))
             raise ValidationError(detail='pick_first and support_multiple both cannot be {}'.format(
-                    data['pick_first'],
+                    pick_first,
                 )
             )
-        return data
 
+    def early_validation(self, data):
+        """
+        Overrides the early_validation method of super class
+        to reject equal pick_first and support_multiple before
+        the schema validation.
+
+        :param data: decoded request json
+        """
+        if isinstance(data, dict) \
+                and isinstance(data.get('pick_first'), bool) \
+                and isinstance(data.get('support_multiple'), bool):
+            self.multiplicity_validation(data['pick_first'], data['support_multiple'])
 
-class NumericValidationJsonParser(parsers.JSONParser):
+
+class NumericValidationJsonParser(LimitedJsonParser):
     """
     Custom parser to parse request JSON according to
     schema for numeric validation defined in schema
@@ -95,22 +248,13 @@ class NumericValidationJsonParser(parsers.JSONParser):
             raise ValidationError(detail='Var name should be present in the constraint')
         
 
-    def parse(self, stream, media_type=None, parser_context=None):
+    def validate(self, data):
         """
-        verride the parse method to validate using the schema
-        as well. Refer to this for more info: 
-        
-        https://www.django-rest-framework.org/api-guide/parsers/#custom-parsers
+        Validate the decoded payload against the schema and the
+        custom rules. Raise error if validation fails.
 
-        :param stream: incoming data body
-        :param media_type: media type of request
-        :param parser_context: to give extra context for parsing
-            if required
-        :return: dictionary of request data, if valid
+        :param data: decoded request json
         """
-        data = super(NumericValidationJsonParser, self).parse(
-            stream, media_type, parser_context,
-        )
         # validate the json using the schema
         try:
             jsonschema.validate(data, self.JSON_SCHEMA)
@@ -118,7 +262,294 @@ class NumericValidationJsonParser(parsers.JSONParser):
             logger.error('Error while validating the json - {}'.format(error))
             raise ValidationError(detail='JSON validation failed. Check logs...')
         self.numeric_validation(data['constraint'], data['var_name'])
-        return data
+
+
+class PatternValidationJsonParser(LimitedJsonParser):
+    """
+    Custom parser to parse request JSON according to
+    schema for pattern validation defined in schema
+    module
+    """
+    JSON_SCHEMA = schemas.pattern_values_json
+    REPEAT_OPCODES = {
+        getattr(sre_constants, name)
+        for name in ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT')
+        if hasattr(sre_constants, name)
+    }
+    BACKREFERENCE_OPCODES = {sre_constants.GROUPREF, sre_constants.GROUPREF_EXISTS}
+    ASSERT_OPCODES = {sre_constants.ASSERT, sre_constants.ASSERT_NOT}
+
+    def get_literal_chars(self, code, ignore_case):
+        """
+        :param code: code point of a literal
+        :param ignore_case: whether the literal is matched ignoring case
+        :return: the characters it can match, see get_char_code
+        """
+        char = chr(code)
+        if not ignore_case:
+            return {get_char_code(char)}
+        variants = {char, char.lower(), char.upper(), char.casefold()}
+        chars = {get_char_code(variant) for variant in variants if len(variant) == 1}
+        if char.isalpha():
+            # some non ascii letters fold to ascii ones, like the kelvin sign
+            chars.add(NON_ASCII_WORD)
+        return chars
+
+    def get_class_chars(self, items, ignore_case):
+        """
+        :param items: the items of a character class (IN)
+        :param ignore_case: whether the class is matched ignoring case
+        :return: the characters it can match, see get_char_code
+        """
+        chars = set()
+        negate = False
+        for opcode, args in items:
+            if opcode == sre_constants.NEGATE:
+                negate = True
+            elif opcode == sre_constants.LITERAL:
+                chars |= self.get_literal_chars(args, ignore_case)
+            elif opcode == sre_constants.RANGE:
+                low, high = args
+                for code in range(low, min(high, max(ASCII_CHARS)) + 1):
+                    chars |= self.get_literal_chars(code, ignore_case)
+                if high > max(ASCII_CHARS):
+                    chars |= ALL_CHARS if ignore_case else NON_ASCII_CHARS
+            else:
+                chars |= CATEGORY_CHARS.get(args, ALL_CHARS)
+        if negate:
+            return (ASCII_CHARS - chars) | NON_ASCII_CHARS
+        return chars
+
+    def get_chars(self, subpattern, ignore_case, first_only=False):
+        """
+        Over approximation of the characters a parsed pattern can match
+
+        :param subpattern: a pattern parsed by sre_parse
+        :param ignore_case: whether it is matched ignoring case
+        :param first_only: only the characters it can start with
+        :return: a set of characters, see get_char_code
+        """
+        chars = set()
+        for index, (opcode, args) in enumerate(subpattern):
+            if opcode == sre_constants.LITERAL:
+                chars |= self.get_literal_chars(args, ignore_case)
+            elif opcode == sre_constants.IN:
+                chars |= self.get_class_chars(args, ignore_case)
+            elif opcode in self.REPEAT_OPCODES:
+                chars |= self.get_chars(args[2], ignore_case, first_only)
+            elif opcode == sre_constants.SUBPATTERN:
+                chars |= self.get_chars(
+                    args[-1], self.get_ignore_case(ignore_case, args), first_only,
+                )
+            elif opcode == getattr(sre_constants, 'ATOMIC_GROUP', None):
+                chars |= self.get_chars(args, ignore_case, first_only)
+            elif opcode == sre_constants.BRANCH:
+                for alternative in args[1]:
+                    chars |= self.get_chars(alternative, ignore_case, first_only)
+            elif opcode not in self.ASSERT_OPCODES and opcode != sre_constants.AT:
+                # any character, a backreference or an unknown opcode
+                chars |= ALL_CHARS
+            if first_only and subpattern[index:index + 1].getwidth()[0] > 0:
+                break
+        return chars
+
+    def get_ignore_case(self, ignore_case, subpattern_args):
+        """
+        :param ignore_case: whether the enclosing pattern ignores case
+        :param subpattern_args: arguments of a group, with the flags
+            it adds and removes like (?i:...)
+        :return: whether the group ignores case
+        """
+        add_flags, del_flags = subpattern_args[1:3]
+        return bool((ignore_case or add_flags & re.IGNORECASE) and not del_flags & re.IGNORECASE)
+
+    def are_alternatives_disjoint(self, alternatives, ignore_case):
+        """
+        To check if at most one alternative of a branch can match at
+        any position, i.e. none of them can match the empty string
+        and no two of them can start with the same character
+
+        :param alternatives: the alternatives of a BRANCH
+        :param ignore_case: whether they are matched ignoring case
+        :return: a boolean value (true if they are disjoint)
+        """
+        seen = set()
+        for alternative in alternatives:
+            if alternative.getwidth()[0] == 0:
+                return False
+            first = self.get_chars(alternative, ignore_case, first_only=True)
+            if first & seen:
+                return False
+            seen |= first
+        return True
+
+    def is_subpattern_safe(self, subpattern, inside_repeat=False, ignore_case=False, adjacent=None):
+        """
+        To check if a parsed pattern is in the subset which cannot
+        backtrack catastrophically, i.e. it has:
+            1. no variable length repeat (like a+ or a{1,5}) inside
+               another repeat (like (a+)+)
+            2. no alternatives which can match at the same position
+               inside a repeat (like (a|aa)+)
+            3. no variable length repeat which can match the characters
+               of an earlier one, when everything between them could be
+               matched by the earlier one too (like \d*\d* or .*a.*)
+            4. no backreferences
+        The check is conservative, some safe patterns are rejected.
+
+        :param subpattern: a pattern parsed by sre_parse
+        :param inside_repeat: whether subpattern is repeated by an
+            enclosing repeat
+        :param ignore_case: whether subpattern is matched ignoring case
+        :param adjacent: characters of each variable length repeat which
+            could match everything up to subpattern, updated as it is
+            walked
+        :return: a boolean value (true if pattern is safe)
+        """
+        adjacent = [] if adjacent is None else adjacent
+        for index, (opcode, args) in enumerate(subpattern):
+            optional = subpattern[index:index + 1].getwidth()[0] == 0
+            if opcode in self.BACKREFERENCE_OPCODES:
+                return False
+            if opcode in self.REPEAT_OPCODES:
+                low, high, child = args
+                if inside_repeat and high != low:
+                    return False
+                if high <= 1:
+                    # at most once, like a group which may be skipped
+                    before = list(adjacent)
+                    if not self.is_subpattern_safe(child, inside_repeat, ignore_case, adjacent):
+                        return False
+                    if optional:
+                        adjacent.extend(before)
+                    continue
+                chars = self.get_chars(child, ignore_case)
+                if high != low:
+                    first = self.get_chars(child, ignore_case, first_only=True)
+                    if any(first & repeat_chars for repeat_chars in adjacent):
+                        return False
+                    if not optional:
+                        adjacent.clear()
+                    adjacent.append(chars)
+                elif not optional:
+                    adjacent[:] = [repeat_chars for repeat_chars in adjacent if chars <= repeat_chars]
+                if not self.is_subpattern_safe(child, True, ignore_case):
+                    return False
+            elif opcode == sre_constants.SUBPATTERN:
+                child_ignore_case = self.get_ignore_case(ignore_case, args)
+                if not self.is_subpattern_safe(args[-1], inside_repeat, child_ignore_case, adjacent):
+                    return False
+            elif opcode == getattr(sre_constants, 'ATOMIC_GROUP', None):
+                if not self.is_subpattern_safe(args, inside_repeat, ignore_case, adjacent):
+                    return False
+            elif opcode == sre_constants.BRANCH:
+                alternatives = args[1]
+                if inside_repeat and not self.are_alternatives_disjoint(alternatives, ignore_case):
+                    return False
+                after = []
+                for alternative in alternatives:
+                    alternative_adjacent = list(adjacent)
+                    if not self.is_subpattern_safe(
+                            alternative, inside_repeat, ignore_case, alternative_adjacent):
+                        return False
+                    after.extend(alternative_adjacent)
+                adjacent[:] = after
+            elif opcode in self.ASSERT_OPCODES:
+                if not self.is_subpattern_safe(args[1], inside_repeat, ignore_case):
+                    return False
+            else:
+                # a single character, or an anchor which matches none. The
+                # earlier repeats which could match it stay adjacent.
+                chars = self.get_chars(subpattern[index:index + 1], ignore_case)
+                adjacent[:] = [repeat_chars for repeat_chars in adjacent if chars <= repeat_chars]
+        return True
+
+    @staticmethod
+    @lru_cache(maxsize=PATTERN_CACHE_SIZE)
+    def get_pattern_error(pattern):
+        """
+        Verdict of pattern_validation, cached like the compiled patterns
+        of the engine as the analysis costs more than compiling
+
+        :param pattern: the regular expression
+        :return: the error detail, None if the pattern is valid and safe
+        """
+        try:
+            parsed = sre_parse.parse(pattern)
+        except re.error:
+            return 'Pattern should be a valid regular expression'
+        # parsing state is called pattern before python 3.11
+        state = getattr(parsed, 'state', None) or parsed.pattern
+        parser = PatternValidationJsonParser()
+        if not parser.is_subpattern_safe(parsed, ignore_case=bool(state.flags & re.IGNORECASE)):
+            return 'Pattern should not have ambiguous repeats or backreferences'
+        return None
+
+    def pattern_validation(self, pattern):
+        """
+        Validate the following conditions:
+            1. the pattern is a valid regular expression
+            2. the pattern cannot backtrack catastrophically
+        Raise error if validation fails.
+
+        :param pattern: the regular expression
+        """
+        error = self.get_pattern_error(pattern)
+        if error is not None:
+            logger.error('Pattern failed validation - {} - {}'.format(pattern, error))
+            raise ValidationError(detail=error)
+
+    def validate(self, data):
+        """
+        Validate the decoded payload against the schema and the
+        custom rules. Raise error if validation fails.
+
+        :param data: decoded request json
+        """
+        # validate the json using the schema
+        try:
+            jsonschema.validate(data, self.JSON_SCHEMA)
+        except Exception as error:
+            logger.error('Error while validating the json - {}'.format(error))
+            raise ValidationError(detail='JSON validation failed. Check logs...')
+        self.pattern_validation(data['pattern'])
+
+
+class DatetimeValidationJsonParser(LimitedJsonParser):
+    """
+    Custom parser to parse request JSON according to
+    schema for datetime validation defined in schema
+    module
+    """
+    JSON_SCHEMA = schemas.datetime_values_json
+
+    def datetime_validation(self, constraint):
+        """
+        Validate that the timezone, the bounds and the times of the
+        day of the constraint can all be resolved.
+        Raise error if validation fails.
+
+        :param constraint: the constraint dictionary
+        """
+        try:
+            DatetimeConstraint(constraint)
+        except SlotValidationError as e:
+            raise ValidationError(detail=e.error_msg)
+
+    def validate(self, data):
+        """
+        Validate the decoded payload against the schema and the
+        custom rules. Raise error if validation fails.
+
+        :param data: decoded request json
+        """
+        # validate the json using the schema
+        try:
+            jsonschema.validate(data, self.JSON_SCHEMA)
+        except Exception as error:
+            logger.error('Error while validating the json - {}'.format(error))
+            raise ValidationError(detail='JSON validation failed. Check logs...')
+        self.datetime_validation(data['constraint'])
 
 
 class IgnoreClientContentNegotiation(negotiation.BaseContentNegotiation):
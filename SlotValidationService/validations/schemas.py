@@ -105,3 +105,127 @@ numeric_values_json = {
     'additionalProperties': False,
     'minProperties': 10,
 }
+
+pattern_values_json = {
+    'name': 'Pattern',
+    'properties': {
+        'invalid_trigger': {
+            'type': 'string',
+        },
+        'key': {
+            'type': 'string',
+        },
+        'name': {
+            'type': 'string',
+        },
+        'reuse': {
+            'type': 'boolean',
+        },
+        'pick_first': {
+            'type': 'boolean',
+        },
+        'type': {
+            'type': 'array',
+            'items': {'type': 'string'},
+        },
+        'validation_parser': {
+            'enum': ['pattern_values_entity', ],
+        },
+        'pattern': {
+            'type': 'string',
+        },
+        'values': {
+            'type': 'array',
+            'items': {
+                'type': 'object',
+                'properties': {
+                    'entity_type': {
+                        'type': 'string',
+                    },
+                    # any type is allowed here
+                    'value': {}
+                },
+                'required': ['entity_type', 'value', ],
+            }
+        },
+    },
+    # to ensure all values are required
+    # and no extra values can be given
+    'additionalProperties': False,
+    'minProperties': 9,
+}
+
+datetime_values_json = {
+    'name': 'Datetime',
+    'properties': {
+        'invalid_trigger': {
+            'type': 'string',
+        },
+        'key': {
+            'type': 'string',
+        },
+        'name': {
+            'type': 'string',
+        },
+        'reuse': {
+            'type': 'boolean',
+        },
+        'pick_first': {
+            'type': 'boolean',
+        },
+        'type': {
+            'type': 'array',
+            'items': {'type': 'string'},
+        },
+        'validation_parser': {
+            'enum': ['datetime_values_entity', ],
+        },
+        'constraint': {
+            'type': 'object',
+            'properties': {
+                'timezone': {
+                    'type': 'string',
+                },
+                'start': {
+                    'type': 'string',
+                },
+                'end': {
+                    'type': 'string',
+                },
+                'weekdays': {
+                    'type': 'array',
+                    'items': {
+                        'type': 'integer',
+                        'minimum': 0,
+                        'maximum': 6,
+                    },
+                },
+                'time_from': {
+                    'type': 'string',
+                },
+                'time_to': {
+                    'type': 'string',
+                },
+            },
+            'additionalProperties': False,
+        },
+        'values': {
+            'type': 'array',
+            'items': {
+                'type': 'object',
+                'properties': {
+                    'entity_type': {
+                        'type': 'string',
+                    },
+                    # any type is allowed here
+                    'value': {}
+                },
+                'required': ['entity_type', 'value', ],
+            }
+        },
+    },
+    # to ensure all values are required
+    # and no extra values can be given
+    'additionalProperties': False,
+    'minProperties': 9,
+}
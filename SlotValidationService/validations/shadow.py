@@ -0,0 +1,197 @@
+"""
+Shadow mode to compare an alternative validation engine with the
+reference one (validations/engine.py) on live traffic.
+
+A sample of the requests served by the validation views is run again
+through the alternative engine, set by the dotted module path in
+SHADOW_ENGINE, which must have the same validation methods as engine.
+The (filled, partially_filled, trigger, params) tuples, or the errors,
+of both are compared and the mismatches and per engine latencies are
+recorded for the metrics endpoint.
+
+The shadow run is off the critical path of the request: the view only
+puts the request in a bounded queue, which is drained by a few
+background threads. Requests are dropped when the queue is full.
+"""
+import copy
+import importlib
+import logging
+import queue
+import random
+import threading
+import time
+from collections import Counter, deque
+from typing import Callable, Dict, Tuple
+
+from django.conf import settings
+
+from .histogram import LatencyHistogram
+from .slot_validation_error import SlotValidationError
+
+logger = logging.getLogger(__name__)
+
+def normalize_outcome(outcome) -> Tuple:
+    """
+    Make engine outcomes comparable: a result tuple is kept as is,
+    errors are reduced to their message and status code
+
+    :param outcome: result tuple or the exception raised by an engine
+    :return: a comparable tuple
+    """
+    if isinstance(outcome, SlotValidationError):
+        return ('error', outcome.error_msg, outcome.status_code)
+    if isinstance(outcome, Exception):
+        return ('crash', type(outcome).__name__)
+    return ('result', ) + tuple(outcome)
+
+class ShadowRunner:
+    """
+    Bounded queue of requests to be validated again by the
+    alternative engine, and the comparison stats
+    """
+
+    def __init__(
+            self,
+            candidate_engine,
+            sample_rate: float,
+            queue_size: int,
+            workers: int,
+            max_mismatches: int,
+        ):
+        """
+        :param candidate_engine: module with the same validation
+            methods as engine
+        :param sample_rate: fraction of the requests to be shadowed
+        :param queue_size: requests waiting for a shadow run
+        :param workers: number of background threads
+        :param max_mismatches: number of latest mismatches kept
+        """
+        self.candidate_engine = candidate_engine
+        self.sample_rate = sample_rate
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.counters = Counter()
+        self.latency = {
+            'reference': LatencyHistogram(),
+            'candidate': LatencyHistogram(),
+        }
+        self.mismatches = deque(maxlen=max_mismatches)
+        self.lock = threading.Lock()
+        for i in range(workers):
+            threading.Thread(target=self.work, name='shadow-{}'.format(i), daemon=True).start()
+
+    def submit(
+            self,
+            validate_slots: Callable,
+            request_data: Dict,
+            reference_outcome,
+            reference_latency: float,
+        ) -> None:
+        """
+        Queue a request for a shadow run if it is sampled. Never blocks.
+
+        :param validate_slots: validate_slots method of the view which
+            served the request, called with the candidate engine
+        :param request_data: the parsed request json
+        :param reference_outcome: result tuple or SlotValidationError
+            of the reference engine
+        :param reference_latency: seconds taken by the reference engine
+        """
+        if random.random() >= self.sample_rate:
+            return
+        try:
+            self.queue.put_nowait((validate_slots, request_data, reference_outcome, reference_latency))
+        except queue.Full:
+            with self.lock:
+                self.counters['dropped'] += 1
+
+    def work(self) -> None:
+        while True:
+            validate_slots, request_data, reference_outcome, reference_latency = self.queue.get()
+            try:
+                self.compare(validate_slots, request_data, reference_outcome, reference_latency)
+            except Exception:
+                logger.exception('Shadow comparison failed')
+
+    def compare(
+            self,
+            validate_slots: Callable,
+            request_data: Dict,
+            reference_outcome,
+            reference_latency: float,
+        ) -> None:
+        """
+        Run the candidate engine and record how it compares with the reference
+        """
+        # the candidate must not be able to alter what the reference saw
+        request_data = copy.deepcopy(request_data)
+        start = time.monotonic()
+        try:
+            candidate_outcome = validate_slots(request_data, self.candidate_engine)
+        except Exception as e:
+            candidate_outcome = e
+        candidate_latency = time.monotonic() - start
+        reference, candidate = normalize_outcome(reference_outcome), normalize_outcome(candidate_outcome)
+        with self.lock:
+            self.counters['compared'] += 1
+            self.latency['reference'].record(reference_latency)
+            self.latency['candidate'].record(candidate_latency)
+            if reference == candidate:
+                self.counters['matched'] += 1
+                return
+            self.counters['mismatched'] += 1
+            self.mismatches.append({
+                'validation_parser': request_data.get('validation_parser'),
+                'name': request_data.get('name'),
+                'reference': reference,
+                'candidate': candidate,
+            })
+        logger.warning('Shadow mismatch for {}: reference {}, candidate {}'.format(
+            request_data.get('name'), reference, candidate,
+        ))
+
+    def snapshot(self) -> Dict:
+        """
+        :return: comparison stats, for the metrics endpoint
+        """
+        with self.lock:
+            return {
+                'candidate_engine': self.candidate_engine.__name__,
+                'sample_rate': self.sample_rate,
+                'queue_depth': self.queue.qsize(),
+                'compared': self.counters['compared'],
+                'matched': self.counters['matched'],
+                'mismatched': self.counters['mismatched'],
+                'dropped': self.counters['dropped'],
+                'latency_ms': {
+                    name: {
+                        'p50': histogram.percentile(50) * 1e3,
+                        'p99': histogram.percentile(99) * 1e3,
+                        'max': histogram.max * 1e3,
+                    }
+                    for name, histogram in self.latency.items()
+                },
+                'recent_mismatches': list(self.mismatches),
+            }
+
+_runner = None
+_runner_lock = threading.Lock()
+
+def get_runner() -> ShadowRunner:
+    """
+    :return: the shadow runner of this worker built from settings,
+        None if shadow mode is disabled
+    """
+    global _runner
+    if not settings.SHADOW_ENGINE:
+        return None
+    if _runner is None:
+        with _runner_lock:
+            if _runner is None:
+                _runner = ShadowRunner(
+                    importlib.import_module(settings.SHADOW_ENGINE),
+                    settings.SHADOW_SAMPLE_RATE,
+                    settings.SHADOW_QUEUE_SIZE,
+                    settings.SHADOW_WORKERS,
+                    settings.SHADOW_MAX_MISMATCHES,
+                )
+    return _runner
@@ -0,0 +1,195 @@
+"""
+Sidecar server for callers on the same host.
+
+Validation requests are served over a Unix domain socket without going
+through HTTP, the django middleware or DRF content negotiation. The
+payload is checked by the same request parser validation rules and
+handed to the same engine methods as the HTTP endpoints, so results
+and errors are the same.
+
+Protocol (all integers in network byte order):
+    request frame:  <4 byte payload length><JSON payload>
+    response frame: <4 byte body length><2 byte status code><JSON body>
+
+The endpoint is picked from the validation_parser key of the payload.
+Connections are persistent, and requests can be pipelined: responses
+come back in the order the requests were sent.
+"""
+import io
+import logging
+import os
+import socket
+import socketserver
+import stat
+import struct
+from typing import Dict, List, Tuple
+
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import ParseError, ValidationError
+from rest_framework.renderers import JSONRenderer
+
+from . import renderers
+from . import request_parsers
+from . import views
+from .slot_validation_error import SlotValidationError
+
+logger = logging.getLogger(__name__)
+
+REQUEST_HEADER = struct.Struct('!I')
+RESPONSE_HEADER = struct.Struct('!IH')
+
+# validation_parser of a payload -> view serving it over HTTP
+ROUTES = {
+    'finite_values_entity': views.FiniteValuesValidationView,
+    'numeric_values_entity': views.NumericValuesValidationView,
+    'pattern_values_entity': views.PatternValuesValidationView,
+    'datetime_values_entity': views.DatetimeValuesValidationView,
+}
+
+class Dispatcher:
+    """
+    Runs a raw payload through the same steps as the HTTP endpoints:
+    JSON decoding, the request parser validation rules and the engine
+    """
+
+    def __init__(self):
+        self.json_parser = request_parsers.LimitedJsonParser()
+        self.renderer = JSONRenderer()
+        # validation_parser -> (request parser, view)
+        self.routes = {
+            name: (view_class.parser_classes[0](), view_class())
+            for name, view_class in ROUTES.items()
+        }
+
+    def dispatch(self, payload: bytes) -> Tuple[int, Dict]:
+        """
+        :param payload: the encoded request json
+        :return: a tuple of (status code, response dict), or of
+            (status code, response body) for validation results
+        """
+        try:
+            data = self.json_parser.decode(io.BytesIO(payload))
+        except ParseError as e:
+            return e.status_code, {'detail': e.detail}
+        except ValidationError as e:
+            return status.HTTP_400_BAD_REQUEST, views.get_error_response_dict(e.detail[0])
+        route = data.get('validation_parser') if isinstance(data, dict) else None
+        if route not in self.routes:
+            logger.error('Unknown validation parser - {}'.format(route))
+            return status.HTTP_400_BAD_REQUEST, views.get_error_response_dict(
+                'JSON validation failed. Check logs...',
+            )
+        parser, view = self.routes[route]
+        try:
+            parser.early_validation(data)
+            parser.validate(data)
+        except ValidationError as e:
+            return status.HTTP_400_BAD_REQUEST, views.get_error_response_dict(e.detail[0])
+        try:
+            validation_tuple = view.validate_slots(data)
+        except SlotValidationError as e:
+            return e.status_code, views.get_error_response_dict(e.error_msg)
+        logger.info('Validation tuple: {}'.format(validation_tuple))
+        return status.HTTP_200_OK, renderers.render_validation_result(validation_tuple)
+
+    def handle(self, payload: bytes) -> bytes:
+        """
+        :param payload: the encoded request json
+        :return: the encoded response frame
+        """
+        try:
+            status_code, response_dict = self.dispatch(payload)
+        except Exception:
+            logger.exception('Unhandled error in sidecar request')
+            status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+            response_dict = {'detail': 'A server error occurred.'}
+        if isinstance(response_dict, bytes):
+            body = response_dict
+        else:
+            body = self.renderer.render(response_dict)
+        return RESPONSE_HEADER.pack(len(body), status_code) + body
+
+class SidecarRequestHandler(socketserver.StreamRequestHandler):
+    """
+    Serves the frames of one persistent connection in order
+    """
+
+    def handle(self):
+        max_frame_bytes = settings.SIDECAR_MAX_FRAME_BYTES
+        while True:
+            header = self.rfile.read(REQUEST_HEADER.size)
+            if len(header) < REQUEST_HEADER.size:
+                # connection closed by the caller
+                return
+            (length, ) = REQUEST_HEADER.unpack(header)
+            if length > max_frame_bytes:
+                logger.error('Sidecar frame of {} bytes is over the limit, closing'.format(length))
+                return
+            payload = self.rfile.read(length)
+            if len(payload) < length:
+                return
+            self.wfile.write(self.server.dispatcher.handle(payload))
+
+class SidecarServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Threaded Unix domain socket server, one thread per connection
+    """
+    daemon_threads = True
+
+    def __init__(self, socket_path: str):
+        try:
+            mode = os.lstat(socket_path).st_mode
+        except FileNotFoundError:
+            pass
+        else:
+            if not stat.S_ISSOCK(mode):
+                raise FileExistsError('{} exists and is not a socket'.format(socket_path))
+            # stale socket of a previous run
+            os.unlink(socket_path)
+        self.dispatcher = Dispatcher()
+        # the socket is created with SIDECAR_SOCKET_MODE, there is no
+        # window where it has wider permissions
+        umask = os.umask(0o777 & ~settings.SIDECAR_SOCKET_MODE)
+        try:
+            super().__init__(socket_path, SidecarRequestHandler)
+        finally:
+            os.umask(umask)
+
+class SidecarClient:
+    """
+    Minimal blocking client of the sidecar protocol
+    """
+
+    def __init__(self, socket_path: str):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(socket_path)
+        self.rfile = self.sock.makefile('rb')
+
+    def send(self, payload: bytes) -> None:
+        self.sock.sendall(REQUEST_HEADER.pack(len(payload)) + payload)
+
+    def receive(self) -> Tuple[int, bytes]:
+        """
+        :return: a tuple of (status code, JSON body) of the oldest pending request
+        """
+        length, status_code = RESPONSE_HEADER.unpack(self.rfile.read(RESPONSE_HEADER.size))
+        return status_code, self.rfile.read(length)
+
+    def validate(self, payload: bytes) -> Tuple[int, bytes]:
+        self.send(payload)
+        return self.receive()
+
+    def pipeline(self, payloads: List[bytes]) -> List[Tuple[int, bytes]]:
+        """
+        Send all the payloads before reading any response
+
+        :param payloads: encoded request jsons
+        :return: (status code, JSON body) for each payload, in order
+        """
+        self.sock.sendall(b''.join(REQUEST_HEADER.pack(len(p)) + p for p in payloads))
+        return [self.receive() for _ in payloads]
+
+    def close(self) -> None:
+        self.rfile.close()
+        self.sock.close()
@@ -23,4 +23,20 @@ class SlotValidationError(Exception):
         """
         self.error_msg = error_msg
         self.status_code = status_code
-        super().__init__(self.error_msg)
\ No newline at end of file
+        super().__init__(self.error_msg)
+
+class OverloadError(SlotValidationError):
+    """
+    Raised when a request is shed by the admission controller
+    because the worker is at capacity.
+    """
+
+    def __init__(self, error_msg, retry_after=1):
+        """
+        :param error_msg: Description of the error to be sent
+            to the client with the error response
+        :param retry_after: seconds after which the client may
+            retry, sent in the Retry-After header
+        """
+        self.retry_after = retry_after
+        super().__init__(error_msg, status.HTTP_503_SERVICE_UNAVAILABLE)
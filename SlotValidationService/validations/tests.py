@@ -1,3 +1,488 @@
-from django.test import TestCase
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timezone
 
-# Create your tests here.
+from django.test import Client, SimpleTestCase
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
+
+from . import renderers
+from .admission import AdmissionController
+from .coalescing import Coalescer
+from .engine import DatetimeConstraint
+from .sidecar import Dispatcher, RESPONSE_HEADER
+from .request_parsers import PatternValidationJsonParser
+from .slot_validation_error import SlotValidationError, OverloadError
+from .views import FiniteValuesValidationView
+
+
+class PatternValidationTest(SimpleTestCase):
+    """
+    Patterns accepted and rejected by the backtracking check of
+    pattern validation
+    """
+    SAFE_PATTERNS = [
+        r'[A-Z]{5}[0-9]{4}[A-Z]',
+        r'\d{3}-\d+',
+        r'[A-Z]+\d+',
+        r'a+b+',
+        r'\w+@\w+\.com',
+        r'[^@\s]+@[a-z0-9-]+\.[a-z]{2,}',
+        r'(\d+)-(\d+)',
+        r'\+?\d{10}',
+        r'\d+(\.\d+)?',
+        r'(\d{3}-)*\d{4}',
+        r'(foo|bar)+',
+        r'(?i)[a-z]+\d+',
+    ]
+    UNSAFE_PATTERNS = [
+        r'(a+)+',
+        r'(\w+)*',
+        r'(a|a)*b',
+        r'(a|aa)*b',
+        r'(\d|\d\d)+x',
+        r'(?i:ab|AC)+',
+        r'(a|b?)+',
+        r'\d*\d*\d*x',
+        r'.*.*=.*',
+        r'.*a.*a.*b',
+        r'.*a.*a.*a.*a.*a.*b',
+        r'\d+0\d+0\d+0\d+x',
+        r'[^@\s]+@[^@\s]+\.[a-z]{2,}',
+        r'(?i)[a-z]+[A-Z]+',
+        r'(a)\1',
+    ]
+
+    def setUp(self):
+        self.parser = PatternValidationJsonParser()
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_safe_patterns(self):
+        for pattern in self.SAFE_PATTERNS:
+            with self.subTest(pattern=pattern):
+                self.parser.pattern_validation(pattern)
+
+    def test_unsafe_patterns(self):
+        for pattern in self.UNSAFE_PATTERNS:
+            with self.subTest(pattern=pattern):
+                with self.assertRaises(ValidationError):
+                    self.parser.pattern_validation(pattern)
+
+    def test_invalid_pattern(self):
+        with self.assertRaises(ValidationError):
+            self.parser.pattern_validation('[a-')
+
+
+class ValidationResultRenderingTest(SimpleTestCase):
+    """
+    The fast path renders the same bytes as JSONRenderer
+    """
+    VALIDATION_TUPLES = [
+        (False, True, 'invalid_ids_stated', {}),
+        (True, False, '', {'ids_stated': ['COLLEGE', 'VOTER']}),
+        (True, False, '', {'age_stated': 12345678901234567890123}),
+        (True, False, '', {'age_stated': -0.5}),
+        (True, False, '', {'name_stated': 'जय हिंद ☃'}),
+        (True, False, '', {'name_stated': 'line\u2028separator\u2029paragraph'}),
+        (False, True, 'invalid_\u00e9t\u2028', {}),
+        (True, False, '', {'ids_stated': [[1, 2, 3], {'hello': 'world'}, None, True]}),
+        (True, False, '', {'quote"and\\backslash': '</script>\n\t'}),
+        (1, 0, 'invalid_ids_stated', {}),
+        (True, False, None, None),
+    ]
+
+    def test_same_bytes_as_json_renderer(self):
+        for validation_tuple in self.VALIDATION_TUPLES:
+            with self.subTest(validation_tuple=validation_tuple):
+                expected = JSONRenderer().render(
+                    FiniteValuesValidationView().create_dict_from_validation_tuple(validation_tuple),
+                )
+                self.assertEqual(renderers.render_validation_result(validation_tuple), expected)
+
+
+class DatetimeConstraintTest(SimpleTestCase):
+    """
+    Resolution of datetime constraints against a fixed reference time
+    """
+    # a Monday, 01:30 on Tuesday in Asia/Kolkata
+    NOW = datetime(2026, 10, 19, 20, 0, tzinfo=timezone.utc)
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def constraint(self, **constraint):
+        return DatetimeConstraint(constraint, self.NOW)
+
+    def is_valid(self, constraint, value):
+        moment = constraint.parse_cached(value)
+        return moment is not None and constraint.is_satisfied(moment)
+
+    def test_relative_bounds(self):
+        constraint = self.constraint(start='today', end='now+2d')
+        self.assertEqual(constraint.start, datetime(2026, 10, 19, tzinfo=timezone.utc))
+        self.assertEqual(constraint.end, datetime(2026, 10, 21, 20, 0, tzinfo=timezone.utc))
+        self.assertTrue(self.is_valid(constraint, '2026-10-19T00:00:00'))
+        self.assertTrue(self.is_valid(constraint, '2026-10-21T20:00:00Z'))
+        self.assertFalse(self.is_valid(constraint, '2026-10-18T23:59:59'))
+        self.assertFalse(self.is_valid(constraint, '2026-10-21T20:00:01Z'))
+
+    def test_relative_bounds_in_timezone(self):
+        constraint = self.constraint(timezone='Asia/Kolkata', start='today', end='today+1w')
+        self.assertEqual(constraint.start.isoformat(), '2026-10-20T00:00:00+05:30')
+        self.assertEqual(constraint.end.isoformat(), '2026-10-27T00:00:00+05:30')
+
+    def test_invalid_bounds(self):
+        for bound in ('today+99999999d', 'now-999999999999w', 'tomorrow', '0001-01-01T00:00:00+00:00'):
+            with self.subTest(bound=bound):
+                with self.assertRaises(SlotValidationError):
+                    self.constraint(timezone='Etc/GMT+12', start=bound)
+
+    def test_time_window_over_midnight(self):
+        constraint = self.constraint(time_from='22:00', time_to='06:00')
+        self.assertTrue(self.is_valid(constraint, '2026-10-19T23:00:00'))
+        self.assertTrue(self.is_valid(constraint, '2026-10-19T02:00:00'))
+        self.assertFalse(self.is_valid(constraint, '2026-10-19T06:00:00'))
+        self.assertFalse(self.is_valid(constraint, '2026-10-19T12:00:00'))
+
+    def test_weekdays(self):
+        constraint = self.constraint(weekdays=[0, 1, 2, 3, 4])
+        self.assertTrue(self.is_valid(constraint, '2026-10-23T12:00:00'))
+        self.assertFalse(self.is_valid(constraint, '2026-10-24T12:00:00'))
+
+    def test_time_only_values_take_the_reference_date(self):
+        constraint = self.constraint(timezone='Asia/Kolkata', start='now')
+        self.assertEqual(constraint.parse('10:30').isoformat(), '2026-10-20T10:30:00+05:30')
+        self.assertTrue(self.is_valid(constraint, '10:30'))
+        self.assertEqual(constraint.parse('Dec 5').isoformat(), '2026-12-05T00:00:00+05:30')
+
+    def test_out_of_range_values(self):
+        constraint = self.constraint()
+        for value in ('0001-01-01T00:00:00+14:00', '9999-12-31T23:00:00-05:00', 1e20, 'not a date'):
+            with self.subTest(value=value):
+                self.assertIsNone(constraint.parse_cached(value))
+
+    def test_bools_are_not_timestamps(self):
+        for values in ([True, 1], [1, True]):
+            with self.subTest(values=values):
+                constraint = self.constraint()
+                self.assertEqual(
+                    [constraint.parse_cached(value) for value in values if value is not True],
+                    [datetime(1970, 1, 1, 0, 0, 1, tzinfo=timezone.utc)],
+                )
+                self.assertIsNone(constraint.parse_cached(True))
+
+
+def wait_until(condition, timeout=5.0):
+    """
+    Poll condition until it is true, fail after timeout seconds
+    """
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('Condition not met in {}s'.format(timeout))
+        time.sleep(0.001)
+
+
+class AdmissionControllerTest(SimpleTestCase):
+    """
+    Queueing, handover and shedding of the admission controller
+    """
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def start_waiter(self, controller, cost, outcomes):
+        """
+        Acquire in a thread, recording the cost once admitted or
+        the error once shed
+        """
+        def acquire():
+            try:
+                controller.acquire(cost)
+            except OverloadError as error:
+                outcomes.append((cost, error))
+            else:
+                outcomes.append((cost, None))
+        thread = threading.Thread(target=acquire, daemon=True)
+        thread.start()
+        return thread
+
+    def test_handover_smallest_first(self):
+        controller = AdmissionController(1, 4, 5.0)
+        controller.acquire(0)
+        outcomes = []
+        for queued, cost in enumerate((30, 10, 20), 1):
+            self.start_waiter(controller, cost, outcomes)
+            wait_until(lambda: controller.queued == queued)
+        for admitted in range(1, 4):
+            controller.release(0.0)
+            wait_until(lambda: len(outcomes) == admitted)
+        self.assertEqual(outcomes, [(10, None), (20, None), (30, None)])
+        self.assertEqual(controller.snapshot()['queue_depth'], 0)
+
+    def test_timeout(self):
+        controller = AdmissionController(1, 4, 0.01)
+        controller.acquire(0)
+        with self.assertRaises(OverloadError):
+            controller.acquire(0)
+        snapshot = controller.snapshot()
+        self.assertEqual((snapshot['queue_depth'], snapshot['shed_timeout']), (0, 1))
+        # the slot goes to the next request, not to the timed out one
+        controller.release(0.0)
+        controller.acquire(0)
+        self.assertEqual(controller.snapshot()['in_flight'], 1)
+
+    def test_timed_out_waiters_are_compacted(self):
+        controller = AdmissionController(1, 2, 0.001)
+        controller.acquire(0)
+        for cost in range(20):
+            with self.assertRaises(OverloadError):
+                controller.acquire(1000 + cost)
+        self.assertLessEqual(len(controller.waiters), 2 * controller.max_queue)
+
+    def test_full_queue_sheds_newcomer_not_smaller(self):
+        controller = AdmissionController(1, 1, 5.0)
+        controller.acquire(0)
+        outcomes = []
+        self.start_waiter(controller, 10, outcomes)
+        wait_until(lambda: controller.queued == 1)
+        with self.assertRaises(OverloadError):
+            controller.acquire(20)
+        controller.release(0.0)
+        wait_until(lambda: outcomes)
+        self.assertEqual(outcomes, [(10, None)])
+
+    def test_full_queue_evicts_largest_for_smaller(self):
+        controller = AdmissionController(1, 1, 5.0)
+        controller.acquire(0)
+        outcomes = []
+        self.start_waiter(controller, 100, outcomes)
+        wait_until(lambda: controller.queued == 1)
+        self.start_waiter(controller, 1, outcomes)
+        wait_until(lambda: outcomes)
+        self.assertEqual(outcomes[0][0], 100)
+        self.assertIsInstance(outcomes[0][1], OverloadError)
+        controller.release(0.0)
+        wait_until(lambda: len(outcomes) == 2)
+        self.assertEqual(outcomes[1], (1, None))
+        self.assertEqual(controller.snapshot()['shed_evicted'], 1)
+
+    def test_full_queue_in_arrival_order(self):
+        controller = AdmissionController(1, 1, 5.0, prioritize_small=False)
+        controller.acquire(0)
+        outcomes = []
+        self.start_waiter(controller, 100, outcomes)
+        wait_until(lambda: controller.queued == 1)
+        with self.assertRaises(OverloadError):
+            controller.acquire(1)
+        controller.release(0.0)
+        wait_until(lambda: outcomes)
+        self.assertEqual(outcomes, [(100, None)])
+
+
+class CoalescerTest(SimpleTestCase):
+    """
+    Sharing of results and errors between identical computations in flight
+    """
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.gate = threading.Event()
+
+    def tearDown(self):
+        self.gate.set()
+        logging.disable(logging.NOTSET)
+
+    def start_call(self, coalescer, key, compute, outcomes):
+        """
+        Run compute through the coalescer in a thread, recording
+        its result or error
+        """
+        def run():
+            try:
+                outcomes.append(('result', coalescer.run(key, compute)))
+            except SlotValidationError as error:
+                outcomes.append(('error', error))
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+    def blocked(self, value):
+        """
+        :return: a computation which returns value once the gate is open
+        """
+        def compute():
+            self.gate.wait(5.0)
+            if isinstance(value, Exception):
+                raise value
+            return value
+        return compute
+
+    def test_followers_share_result(self):
+        coalescer = Coalescer(4, 5.0)
+        result = {'filled': True}
+        outcomes = []
+        threads = [self.start_call(coalescer, 'key', self.blocked(result), outcomes)]
+        wait_until(lambda: coalescer.snapshot()['in_flight_keys'] == 1)
+        for followers in range(1, 3):
+            threads.append(self.start_call(coalescer, 'key', lambda: {'filled': False}, outcomes))
+            wait_until(lambda: coalescer.snapshot()['followers'] == followers)
+        self.gate.set()
+        for thread in threads:
+            thread.join(5.0)
+        self.assertEqual(len(outcomes), 3)
+        for outcome in outcomes:
+            self.assertEqual(outcome[0], 'result')
+            self.assertIs(outcome[1], result)
+        snapshot = coalescer.snapshot()
+        self.assertEqual((snapshot['leaders'], snapshot['coalesced']), (1, 2))
+        self.assertEqual(snapshot['in_flight_keys'], 0)
+
+    def test_followers_share_error(self):
+        coalescer = Coalescer(4, 5.0)
+        error = SlotValidationError('Key is empty', 500)
+        outcomes = []
+        threads = [self.start_call(coalescer, 'key', self.blocked(error), outcomes)]
+        wait_until(lambda: coalescer.snapshot()['in_flight_keys'] == 1)
+        threads.append(self.start_call(coalescer, 'key', lambda: {'filled': True}, outcomes))
+        wait_until(lambda: coalescer.snapshot()['followers'] == 1)
+        self.gate.set()
+        for thread in threads:
+            thread.join(5.0)
+        self.assertEqual(outcomes, [('error', error), ('error', error)])
+        self.assertEqual(coalescer.snapshot()['in_flight_keys'], 0)
+
+    def test_wait_timeout(self):
+        coalescer = Coalescer(4, 0.01)
+        outcomes = []
+        leader = self.start_call(coalescer, 'key', self.blocked('leader'), outcomes)
+        wait_until(lambda: coalescer.snapshot()['in_flight_keys'] == 1)
+        # the follower gives up on the leader and computes on its own
+        self.assertEqual(coalescer.run('key', lambda: 'alone'), 'alone')
+        self.assertEqual(coalescer.snapshot()['wait_timeouts'], 1)
+        self.gate.set()
+        leader.join(5.0)
+        self.assertEqual(outcomes, [('result', 'leader')])
+        self.assertEqual(coalescer.snapshot()['coalesced'], 0)
+
+    def test_max_keys_bypass(self):
+        coalescer = Coalescer(1, 5.0)
+        outcomes = []
+        leader = self.start_call(coalescer, 'first', self.blocked('first'), outcomes)
+        wait_until(lambda: coalescer.snapshot()['in_flight_keys'] == 1)
+        # a second key runs right away without being tracked
+        self.assertEqual(coalescer.run('second', lambda: 'second'), 'second')
+        snapshot = coalescer.snapshot()
+        self.assertEqual((snapshot['bypassed'], snapshot['in_flight_keys']), (1, 1))
+        self.gate.set()
+        leader.join(5.0)
+        self.assertEqual(outcomes, [('result', 'first')])
+        self.assertEqual(coalescer.snapshot()['in_flight_keys'], 0)
+
+
+FINITE_PAYLOAD = {
+    'invalid_trigger': 'invalid_ids_stated',
+    'key': 'ids_stated',
+    'name': 'govt_id',
+    'reuse': True,
+    'support_multiple': True,
+    'pick_first': False,
+    'supported_values': ['pan', 'aadhaar', 'college', 'corporate', 'dl', 'voter', 'passport', 'local'],
+    'type': ['id'],
+    'validation_parser': 'finite_values_entity',
+    'values': [{'entity_type': 'id', 'value': 'college'}],
+}
+NUMERIC_PAYLOAD = {
+    'invalid_trigger': 'invalid_age',
+    'key': 'age_stated',
+    'name': 'age',
+    'reuse': True,
+    'pick_first': True,
+    'type': ['number'],
+    'validation_parser': 'numeric_values_entity',
+    'constraint': 'x>=18 and x<=30',
+    'var_name': 'x',
+    'values': [{'entity_type': 'number', 'value': 23}],
+}
+PATTERN_PAYLOAD = dict(
+    NUMERIC_PAYLOAD,
+    validation_parser='pattern_values_entity',
+    pattern='[A-Z]{5}[0-9]{4}[A-Z]',
+    values=[{'entity_type': 'id', 'value': 'ABCDE1234F'}, {'entity_type': 'id', 'value': 'x'}],
+)
+del PATTERN_PAYLOAD['constraint'], PATTERN_PAYLOAD['var_name']
+DATETIME_PAYLOAD = dict(
+    PATTERN_PAYLOAD,
+    validation_parser='datetime_values_entity',
+    constraint={'timezone': 'Asia/Kolkata', 'weekdays': [0, 1, 2, 3, 4]},
+    values=[{'entity_type': 'date', 'value': '2026-10-19T10:00:00'}],
+)
+del DATETIME_PAYLOAD['pattern']
+
+
+class SidecarParityTest(SimpleTestCase):
+    """
+    The sidecar sends back the same status and body as the HTTP endpoints
+    """
+    ENDPOINTS = {
+        'finite_values_entity': '/validate/finite/',
+        'numeric_values_entity': '/validate/numeric/',
+        'pattern_values_entity': '/validate/pattern/',
+        'datetime_values_entity': '/validate/datetime/',
+    }
+    PAYLOADS = [
+        FINITE_PAYLOAD,
+        dict(FINITE_PAYLOAD, values=[{'entity_type': 'id', 'value': 'x'}, {'entity_type': 'id', 'value': 'pan'}]),
+        dict(FINITE_PAYLOAD, values=[]),
+        dict(FINITE_PAYLOAD, pick_first=True),
+        dict(FINITE_PAYLOAD, pick_first=True, reuse='x'),
+        dict(FINITE_PAYLOAD, invalid_trigger=''),
+        dict(FINITE_PAYLOAD, values=[{'entity_type': 'id', 'value': 'pan'}] * 1001),
+        dict(FINITE_PAYLOAD, supported_values=[[[[[[[[[[[[[[[[[[[[[[[[[[[[[[[[[['x']]]]]]]]]]]]]]]]]]]]]]]]]]]]]]]]]]),
+        NUMERIC_PAYLOAD,
+        dict(NUMERIC_PAYLOAD, constraint='x +'),
+        dict(NUMERIC_PAYLOAD, key=''),
+        PATTERN_PAYLOAD,
+        dict(PATTERN_PAYLOAD, pattern='(a|aa)*b'),
+        DATETIME_PAYLOAD,
+        dict(DATETIME_PAYLOAD, constraint={'start': 'today+99999999d'}),
+    ]
+    # bodies which are not a valid payload, sent to the finite endpoint
+    BODIES = [b'{bad', b'[]', b'[1]', b'1', b'null', b'{}']
+
+    def setUp(self):
+        self.client = Client()
+        self.dispatcher = Dispatcher()
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def assert_same_response(self, path, body):
+        response = self.client.post(path, body, content_type='application/json')
+        frame = self.dispatcher.handle(body)
+        length, status_code = RESPONSE_HEADER.unpack(frame[:RESPONSE_HEADER.size])
+        self.assertEqual(status_code, response.status_code)
+        self.assertEqual(frame[RESPONSE_HEADER.size:], response.content)
+
+    def test_payloads(self):
+        for payload in self.PAYLOADS:
+            with self.subTest(payload=payload):
+                path = self.ENDPOINTS[payload['validation_parser']]
+                self.assert_same_response(path, json.dumps(payload).encode())
+
+    def test_invalid_bodies(self):
+        for body in self.BODIES:
+            with self.subTest(body=body):
+                self.assert_same_response('/validate/finite/', body)
@@ -2,16 +2,26 @@
 Controller for the service
 """
 import logging
+import time
 from typing import List, Dict, Callable, Tuple
+from django.conf import settings
+from django.http import HttpResponse
 from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.renderers import JSONRenderer
-from rest_framework import views, status
+from rest_framework import views, status, permissions
 
 from . import request_parsers
 from . import engine
+from . import profiler
+from . import admission
+from . import shadow
+from . import memory
+from . import renderers
+from . import coalescing
+from . import payload_limits
 from .engine import SlotValidationResult
-from .slot_validation_error import SlotValidationError
+from .slot_validation_error import SlotValidationError, OverloadError
 
 logger = logging.getLogger(__name__)
 
@@ -57,35 +67,95 @@ class FiniteValuesValidationView(views.APIView):
             'parameters': validation_tuple[3],
         }
 
-    def validate_slots(self, request_data: Dict) -> Dict:
+    def validate_slots(self, request_data: Dict, validation_engine=engine) -> SlotValidationResult:
         """
         Validates the incoming request data with slot
         validation from engine. It unpacks data as well.
+        Errors of the engine are raised as SlotValidationError.
 
         :param request_data: a dictionary of request json
-        :return: return the response dict
+        :param validation_engine: module with the validation methods,
+            an alternative one is given in shadow mode
+        :return: a tuple of (filled, partially_filled, trigger, params)
         """
         logger.info('Validating slots for {}'.format(request_data['name']))
+        return validation_engine.validate_finite_values_entity(
+            request_data['values'],
+            request_data['supported_values'],
+            request_data['invalid_trigger'],
+            request_data['key'],
+            request_data['support_multiple'],
+            request_data['pick_first'],
+        )
+
+    def coalesce_validate_slots(self, request_data: Dict) -> SlotValidationResult:
+        """
+        Same as validate_slots, but identical requests in flight
+        share a single engine run when coalescing is enabled
+
+        :param request_data: a dictionary of request json
+        :return: a tuple of (filled, partially_filled, trigger, params)
+        """
+        coalescer = coalescing.get_coalescer()
+        if coalescer is None:
+            return self.shadow_validate_slots(request_data)
+        # only the requests which run the engine are timed and shadowed,
+        # not the ones waiting for them
+        return coalescer.run(
+            coalescing.payload_key(type(self).__name__, request_data),
+            lambda: self.shadow_validate_slots(request_data),
+        )
+
+    def shadow_validate_slots(self, request_data: Dict) -> SlotValidationResult:
+        """
+        Same as validate_slots, the outcome and latency of the engine
+        are submitted for comparison when shadow mode is enabled
+
+        :param request_data: a dictionary of request json
+        :return: a tuple of (filled, partially_filled, trigger, params)
+        """
+        shadow_runner = shadow.get_runner()
+        if shadow_runner is None:
+            return self.validate_slots(request_data)
+        start = time.monotonic()
         try:
-            validation_tuple = engine.validate_finite_values_entity(
-                request_data['values'],
-                request_data['supported_values'],
-                request_data['invalid_trigger'],
-                request_data['key'],
-                request_data['support_multiple'],
-                request_data['pick_first'],
+            validation_tuple = self.validate_slots(request_data)
+        except SlotValidationError as e:
+            shadow_runner.submit(self.validate_slots, request_data, e, time.monotonic() - start)
+            raise
+        shadow_runner.submit(self.validate_slots, request_data, validation_tuple, time.monotonic() - start)
+        return validation_tuple
+
+    def post(self, request, *args, **kwargs):
+        """
+        Override the post method for POST requests.
+        The request is only validated once it is within the
+        memory budget and gets through the admission controller.
+
+        :param request: the http request object
+        :return: a response object
+        """
+        body_bytes = payload_limits.get_content_length(request)
+        try:
+            memory.check_budget(body_bytes)
+            with admission.admit(body_bytes):
+                with memory.trace(body_bytes):
+                    return self.validate_request(request)
+        except OverloadError as e:
+            return Response(
+                get_error_response_dict(e.error_msg),
+                status=e.status_code,
+                headers={'Retry-After': str(e.retry_after)},
             )
-        except engine.SlotValidationError as e:
+        except SlotValidationError as e:
             return Response(
                 get_error_response_dict(e.error_msg),
                 status=e.status_code,
             )
-        logger.info('Validation tuple: {}'.format(validation_tuple))
-        return self.create_dict_from_validation_tuple(validation_tuple)    
 
-    def post(self, request, *args, **kwargs):
+    def validate_request(self, request):
         """
-        Override the post method for POST requests
+        Parses the payload and validates the slots
 
         :param request: the http request object
         :return: a response object
@@ -98,8 +168,25 @@ class FiniteValuesValidationView(views.APIView):
                 get_error_response_dict(e.detail[0]),
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        response_dict = self.validate_slots(request.data)
-        return Response(response_dict)
+        if not request.data:
+            # no body (or a malformed Content-Length), the parser did not run
+            logger.error('Request body is empty')
+            return Response(
+                get_error_response_dict('Request body cannot be empty.'),
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            with memory.phase('engine'):
+                validation_tuple = self.coalesce_validate_slots(request.data)
+        except SlotValidationError as e:
+            return Response(
+                get_error_response_dict(e.error_msg),
+                status=e.status_code,
+            )
+        logger.info('Validation tuple: {}'.format(validation_tuple))
+        if settings.RESPONSE_FAST_PATH:
+            return renderers.validation_result_response(validation_tuple)
+        return Response(self.create_dict_from_validation_tuple(validation_tuple))
 
 class NumericValuesValidationView(FiniteValuesValidationView):
     """
@@ -111,31 +198,157 @@ class NumericValuesValidationView(FiniteValuesValidationView):
         request_parsers.NumericValidationJsonParser,
     )
 
-    def validate_slots(self, request_dict: Dict) -> Dict:
+    def validate_slots(self, request_dict: Dict, validation_engine=engine) -> SlotValidationResult:
         """
         Overrides the validate_slots method of super class.
 
         :param request_dict: a dictionary of request json
-        :return: response dictionary
+        :param validation_engine: module with the validation methods
+        :return: a tuple of (filled, partially_filled, trigger, params)
+        """
+        return validation_engine.validate_numeric_entity(
+            request_dict['values'],
+            request_dict['invalid_trigger'],
+            request_dict['key'],
+            not request_dict['pick_first'], 
+            # this json key is given in the method
+            # definition but not in the request json
+            request_dict['pick_first'],
+            request_dict['constraint'],
+            request_dict['var_name'],
+        )
+
+class PatternValuesValidationView(FiniteValuesValidationView):
+    """
+    Entity validation performed with a regular expression.
+    Inherits FiniteValuesValidation and override the validate_slots
+    method to the pattern validation engine method instead of finite.
+    """
+    parser_classes = (
+        request_parsers.PatternValidationJsonParser,
+    )
+
+    def validate_slots(self, request_dict: Dict, validation_engine=engine) -> SlotValidationResult:
+        """
+        Overrides the validate_slots method of super class.
+
+        :param request_dict: a dictionary of request json
+        :param validation_engine: module with the validation methods
+        :return: a tuple of (filled, partially_filled, trigger, params)
+        """
+        return validation_engine.validate_pattern_entity(
+            request_dict['values'],
+            request_dict['invalid_trigger'],
+            request_dict['key'],
+            not request_dict['pick_first'],
+            request_dict['pick_first'],
+            request_dict['pattern'],
+        )
+
+class DatetimeValuesValidationView(FiniteValuesValidationView):
+    """
+    Entity validation performed over dates and times.
+    Inherits FiniteValuesValidation and override the validate_slots
+    method to the datetime validation engine method instead of finite.
+    """
+    parser_classes = (
+        request_parsers.DatetimeValidationJsonParser,
+    )
+
+    def validate_slots(self, request_dict: Dict, validation_engine=engine) -> SlotValidationResult:
+        """
+        Overrides the validate_slots method of super class.
+
+        :param request_dict: a dictionary of request json
+        :param validation_engine: module with the validation methods
+        :return: a tuple of (filled, partially_filled, trigger, params)
+        """
+        return validation_engine.validate_datetime_entity(
+            request_dict['values'],
+            request_dict['invalid_trigger'],
+            request_dict['key'],
+            not request_dict['pick_first'],
+            request_dict['pick_first'],
+            request_dict['constraint'],
+        )
+
+class ProfileView(views.APIView):
+    """
+    Admin only endpoint to sample the live worker for a bounded window
+    and get back the aggregated stacks in collapsed flame graph format.
+
+    Query params (both optional):
+        seconds: length of the window
+        interval: time between two samples
+    """
+    renderer_classes = [JSONRenderer, ]
+    permission_classes = [permissions.IsAdminUser, ]
+
+    def get(self, request, *args, **kwargs):
+        """
+        Override the get method for GET requests
+
+        :param request: the http request object
+        :return: a plain text response of collapsed stacks
         """
         try:
-            validation_tuple = engine.validate_numeric_entity(
-                request_dict['values'],
-                request_dict['invalid_trigger'],
-                request_dict['key'],
-                not request_dict['pick_first'], 
-                # this json key is given in the method
-                # definition but not in the request json
-                request_dict['pick_first'],
-                request_dict['constraint'],
-                request_dict['var_name'],
+            seconds = float(request.query_params.get(
+                'seconds', settings.PROFILER_DEFAULT_SECONDS,
+            ))
+            interval = float(request.query_params.get(
+                'interval', settings.PROFILER_DEFAULT_INTERVAL,
+            ))
+        except ValueError:
+            return Response(
+                get_error_response_dict('seconds and interval should be numbers.'),
+                status=status.HTTP_400_BAD_REQUEST,
             )
+        try:
+            collapsed = profiler.profile(seconds, interval)
         except SlotValidationError as e:
             return Response(
                 get_error_response_dict(e.error_msg),
                 status=e.status_code,
             )
-        logger.info('Validation tuple: {}'.format(validation_tuple))
-        return self.create_dict_from_validation_tuple(validation_tuple)
+        return HttpResponse(collapsed, content_type='text/plain')
+
+class MetricsView(views.APIView):
+    """
+    Admin only endpoint exposing the counters of this worker
+    """
+    renderer_classes = [JSONRenderer, ]
+    permission_classes = [permissions.IsAdminUser, ]
+
+    def get(self, request, *args, **kwargs):
+        """
+        Override the get method for GET requests
 
+        :param request: the http request object
+        :return: a response object with the metrics
+        """
+        controller = admission.get_controller()
+        shadow_runner = shadow.get_runner()
+        coalescer = coalescing.get_coalescer()
+        return Response({
+            'admission': controller.snapshot() if controller else None,
+            'shadow': shadow_runner.snapshot() if shadow_runner else None,
+            'coalescing': coalescer.snapshot() if coalescer else None,
+        })
 
+class MemoryView(views.APIView):
+    """
+    Admin only endpoint exposing the memory accounting of the
+    traced requests: peak allocation per phase and the largest
+    allocation sites
+    """
+    renderer_classes = [JSONRenderer, ]
+    permission_classes = [permissions.IsAdminUser, ]
+
+    def get(self, request, *args, **kwargs):
+        """
+        Override the get method for GET requests
+
+        :param request: the http request object
+        :return: a response object with the memory stats
+        """
+        return Response(memory.stats.snapshot())